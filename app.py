@@ -13,7 +13,7 @@ from resources.routes.presentations import slides_blueprint
 from resources.routes.outlines import outline_blueprint
 from resources.routes.history import history_blueprint
 from resources.routes.resources import resource_blueprint
-from core.database.database import test_connection
+from core.database.database import test_connection, get_db_pool_stats
 
 def create_app():
     # Initialize Flask app
@@ -341,6 +341,7 @@ def create_app():
         try:
             # Test database connection
             db_status = test_connection()
+            db_pool = get_db_pool_stats()
             
             # Test file system
             temp_dir = tempfile.gettempdir()
@@ -352,6 +353,7 @@ def create_app():
                     "database": db_status,
                     "filesystem": fs_writable,
                 },
+                "database_pool": db_pool,
                 "version": "1.0.0",
                 "environment": os.environ.get("FLASK_ENV", "production")
             })
@@ -1,6 +1,10 @@
 # config/settings.py - CLEANED VERSION
 import os
+import queue
+import atexit
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Any, List
 from openai import OpenAI
 from google_auth_oauthlib.flow import Flow
@@ -15,6 +19,54 @@ SCOPES = [
     'openid'
 ]
 
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the QueueListener thread.
+    The stock prepare() formats the record (and its traceback) in the
+    calling thread; here only the message arguments are merged.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# One QueueListener per process, shared by every config instance. A forked
+# child (gunicorn worker) inherits the queue handler but not the listener
+# thread, so the child gets a fresh queue and its own listener.
+_log_handlers = ()
+_log_queue_handler = None
+_log_listener = None
+_log_listener_pid = None
+_log_listener_lock = threading.Lock()
+
+def _start_log_listener():
+    """Start this process's log listener if it is not running yet."""
+    global _log_listener, _log_listener_pid
+    with _log_listener_lock:
+        if _log_queue_handler is None or _log_listener_pid == os.getpid():
+            return
+        log_queue = queue.SimpleQueue()
+        _log_queue_handler.queue = log_queue
+        _log_listener = QueueListener(log_queue, *_log_handlers, respect_handler_level=True)
+        _log_listener.start()
+        _log_listener_pid = os.getpid()
+
+def _restart_log_listener_after_fork():
+    """Give a forked child its own listener (the parent's lock may have been held at fork)."""
+    global _log_listener_lock
+    _log_listener_lock = threading.Lock()
+    _start_log_listener()
+
+def _stop_log_listener():
+    """Drain and stop this process's log listener."""
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        _log_listener.stop()
+
+atexit.register(_stop_log_listener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_log_listener_after_fork)
+
 class BaseConfig:
     """Base configuration class with shared settings."""
     
@@ -44,9 +96,17 @@ class BaseConfig:
 
     def _setup_logging(self) -> None:
         """Configure logging settings with Azure compatibility."""
+        global _log_handlers, _log_queue_handler
         import sys
         import tempfile
         
+        if _log_queue_handler is not None:
+            # Already configured by an earlier config instance in this process
+            _start_log_listener()
+            self.log_listener = _log_listener
+            self.logger = logging.getLogger(__name__)
+            return
+
         # Determine log file location
         if self.DEVELOPMENT_MODE:
             log_dir = "logs"
@@ -66,10 +126,21 @@ class BaseConfig:
             except Exception as e:
                 print(f"Warning: Could not create log file at {log_path}: {e}")
 
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            for handler in handlers:
+                handler.setFormatter(formatter)
+
+            # Request threads only enqueue records; formatting (including
+            # logger.exception tracebacks) and I/O happen on the listener thread,
+            # which _start_log_listener() attaches to the handler's queue
+            _log_handlers = tuple(handlers)
+            _log_queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+            _start_log_listener()
+            self.log_listener = _log_listener
+
             logging.basicConfig(
                 level=logging.INFO,
-                format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                handlers=handlers
+                handlers=[_log_queue_handler]
             )
             
             self.logger = logging.getLogger(__name__)
@@ -1,9 +1,27 @@
 # core/auth/decorators.py - IMPROVED with clear user vs IP separation
 from functools import wraps
-from flask import request, jsonify, session
+import json
+from flask import Response, request, jsonify, session
 from core.database.usage_v2 import UsageTracker
+from core.database.usage import sanitize_ip_address, tier_from_claim
 from config.settings import logger
 
+# Optional orjson import - faster re-serialization of responses carrying usage limits
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _jloads(data):
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+def _json_response(payload):
+    """Serialize a view payload without going through jsonify's pure-Python encoder."""
+    if ORJSON_AVAILABLE:
+        return Response(orjson.dumps(payload), mimetype='application/json')
+    return Response(json.dumps(payload, separators=(',', ':')), mimetype='application/json')
+
 def is_example_request(request_data):
     """
     COMPREHENSIVE example request detection.
@@ -114,6 +132,19 @@ def check_usage_limits(action_type='generation', skip_increment=False):
             if ip_address:
                 ip_address = ip_address.split(',')[0].strip()
             
+            # A garbled forwarded hop would make the anonymous lookup raise and the
+            # request run unchecked - fall back to the peer address instead
+            if ip_address and sanitize_ip_address(ip_address) is None:
+                logger.warning(f"Unparseable X-Forwarded-For hop {ip_address!r}, using remote address")
+                ip_address = request.remote_addr
+            
+            if not user_id and sanitize_ip_address(ip_address) is None:
+                logger.warning(f"No valid client IP for anonymous request: {ip_address!r}")
+                return jsonify({
+                    "error": "Invalid request",
+                    "details": "Could not determine client address"
+                }), 400
+            
             effective_action_type = action_type
             
             # IMPROVED: Clear logging about what we're tracking
@@ -149,7 +180,9 @@ def check_usage_limits(action_type='generation', skip_increment=False):
                     logger.info("TEST REQUEST DETECTED - Will count against limits but avoid expensive API calls")
                 
                 # NEW ROBUST TRACKING: Check limits with clean separation
-                limits_result = UsageTracker.check_limits(user_id, ip_address, user_email)
+                # A tier claim set by /auth/check saves the users lookup
+                cached_tier = tier_from_claim(session.get('tier_claim'), user_id) if user_id else None
+                limits_result = UsageTracker.check_limits(user_id, ip_address, user_email, cached_tier)
                 
                 logger.info(f"Limits check: {limits_result}")
                 
@@ -250,16 +283,24 @@ def check_usage_limits(action_type='generation', skip_increment=False):
                         logger.debug(f"File download detected, returning unmodified response")
                         return result
                 
+                # Streamed (NDJSON) and other non-JSON bodies cannot be merged with usage
+                # limits, so hand them back untouched instead of replacing them
+                response_obj = result[0] if isinstance(result, tuple) else result
+                if getattr(response_obj, 'is_streamed', False) or (
+                        hasattr(response_obj, 'is_json') and not response_obj.is_json):
+                    logger.debug("Streamed or non-JSON response, returning unmodified response")
+                    return result
+                
                 # For JSON responses, add updated usage limits (only for generation endpoints)
                 if effective_action_type == 'generation' or is_regeneration:
                     # Get updated usage after increment
-                    updated_limits = UsageTracker.check_limits(user_id, ip_address, user_email)
+                    updated_limits = UsageTracker.check_limits(user_id, ip_address, user_email, cached_tier)
                     
                     if isinstance(result, tuple):
                         response, status_code = result
-                        if hasattr(response, 'get_json'):
+                        if hasattr(response, 'get_data'):
                             try:
-                                response_data = response.get_json() or {}
+                                response_data = _jloads(response.get_data()) or {}
                                 response_data.update({
                                     "usage_limits": {
                                         "generations_left": updated_limits['generations_left'],
@@ -274,15 +315,15 @@ def check_usage_limits(action_type='generation', skip_increment=False):
                                         "tracking_method": updated_limits['tracking_method']
                                     }
                                 })
-                                return jsonify(response_data), status_code
+                                return _json_response(response_data), status_code
                             except:
                                 return result
                         return result
                     
                     # If the result is a Flask response object with JSON
-                    if hasattr(result, 'get_json'):
+                    if hasattr(result, 'get_data'):
                         try:
-                            response_data = result.get_json() or {}
+                            response_data = _jloads(result.get_data()) or {}
                             response_data.update({
                                 "usage_limits": {
                                     "generations_left": updated_limits['generations_left'],
@@ -297,7 +338,7 @@ def check_usage_limits(action_type='generation', skip_increment=False):
                                     "tracking_method": updated_limits['tracking_method']
                                 }
                             })
-                            return jsonify(response_data)
+                            return _json_response(response_data)
                         except:
                             return result
                 
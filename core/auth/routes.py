@@ -27,10 +27,12 @@ def check_auth():
                 # Always verify current subscription status from database
                 user = get_user_by_email(session['user_email'])
                 if user:
-                    from core.database.usage import check_user_limits, get_user_subscription_tier
+                    from core.database.usage import get_usage_result, make_tier_claim
                     
-                    user_tier = get_user_subscription_tier(user['id'], session['user_email'])
-                    usage = check_user_limits(user['id'], request.remote_addr)
+                    # The limits check resolves the tier from the usage row
+                    usage = get_usage_result(user['id'], request.remote_addr)
+                    user_tier = usage.user_tier
+                    session['tier_claim'] = make_tier_claim(user['id'], user_tier)
                     
                     user_data = {
                         'id': session['user_id'],
@@ -48,12 +50,15 @@ def check_auth():
                         'authenticated': True,
                         'user': user_data,
                         "usage_limits": {
-                            "generations_left": usage['generations_left'],
-                            "downloads_left": usage['downloads_left'],
-                            "reset_time": usage['reset_time'],
+                            "generations_left": usage.generations_left,
+                            "downloads_left": usage.downloads_left,
+                            "reset_time": usage.reset_time,
                             "is_premium": user_tier == 'premium',
                             "user_tier": user_tier,
-                            "current_usage": usage['current_usage']
+                            "current_usage": {
+                                "generations_used": usage.generations_used,
+                                "downloads_used": usage.downloads_used
+                            }
                         }
                     }), 200
                 else:
@@ -92,10 +97,11 @@ def check_auth():
         try:
             user = get_user_by_email(user_info.get('email'))
             if user:
-                from core.database.usage import check_user_limits, get_user_subscription_tier
+                from core.database.usage import get_usage_result, make_tier_claim
                 
-                user_tier = get_user_subscription_tier(user['id'], user_info.get('email'))
-                usage = check_user_limits(user['id'], request.remote_addr)
+                usage = get_usage_result(user['id'], request.remote_addr)
+                user_tier = usage.user_tier
+                session['tier_claim'] = make_tier_claim(user['id'], user_tier)
                 
                 return jsonify({
                     "authenticated": True,
@@ -109,12 +115,15 @@ def check_auth():
                         "subscription_status": user.get('subscription_status', 'active')
                     },
                     "usage_limits": {
-                        "generations_left": usage['generations_left'],
-                        "downloads_left": usage['downloads_left'],
-                        "reset_time": usage['reset_time'],
+                        "generations_left": usage.generations_left,
+                        "downloads_left": usage.downloads_left,
+                        "reset_time": usage.reset_time,
                         "is_premium": user_tier == 'premium',
                         "user_tier": user_tier,
-                        "current_usage": usage['current_usage']
+                        "current_usage": {
+                            "generations_used": usage.generations_used,
+                            "downloads_used": usage.downloads_used
+                        }
                     }
                 })
         except Exception as db_error:
@@ -13,4 +13,5 @@ from .database import (
 from .usage import (
     check_user_limits,
     increment_usage,
+    invalidate_subscription_tier,
 )
@@ -2,14 +2,30 @@
 import os
 import sys
 import json
+import atexit
 import logging
+import threading
 import psycopg2
 from contextlib import contextmanager
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, register_default_json, register_default_jsonb
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+# Optional orjson import - faster decoding of json/jsonb columns when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# psycopg2 already returns json/jsonb columns as Python objects; decode them
+# with orjson instead of the stdlib when it is available
+if ORJSON_AVAILABLE:
+    register_default_json(globally=True, loads=orjson.loads)
+    register_default_jsonb(globally=True, loads=orjson.loads)
+
 # Database configuration with environment variables
 DB_CONFIG = {
     'dbname': os.environ.get('POSTGRES_DB', 'teacherfy_db'),
@@ -20,14 +36,133 @@ DB_CONFIG = {
     'sslmode': 'require'
 }
 
+# Connection pool sizing - connections are reused across requests instead of
+# paying the TCP + TLS + auth handshake on every get_db_connection() call.
+# Only a small warm minimum is opened up front: every gunicorn worker (and
+# celery process) holds its own pool, so a per-thread minimum multiplies
+# into idle server connections. The pool grows on demand up to the maximum.
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '32'))
+
+# Optional read replica (libpq DSN) for staleness-tolerant reads such as the
+# subscription tier lookup; without it readonly work uses the primary pool.
+# It serves a fraction of the primary's traffic, so it is sized separately.
+READ_REPLICA_DSN = os.environ.get('READ_REPLICA_DSN')
+DB_REPLICA_POOL_MIN_SIZE = int(os.environ.get('DB_REPLICA_POOL_MIN_SIZE', '1'))
+DB_REPLICA_POOL_MAX_SIZE = int(os.environ.get('DB_REPLICA_POOL_MAX_SIZE', '8'))
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Pooled connection that remembers which statements it has PREPAREd."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_lock = threading.Lock()
+
+_replica_pool = None
+_replica_pool_pid = None
+
+# Checkout counters - requested > acquired (or a rising exhausted count)
+# means requests are failing on pool starvation
+_db_pool_stats = {
+    'connections_requested': 0,
+    'connections_acquired': 0,
+    'connections_exhausted': 0,
+}
+_db_pool_stats_lock = threading.Lock()
+
+def _count_pool_event(name):
+    with _db_pool_stats_lock:
+        _db_pool_stats[name] += 1
+
+def get_db_pool_stats():
+    """Get connection pool checkout counters and sizing for health checks."""
+    with _db_pool_stats_lock:
+        stats = dict(_db_pool_stats)
+    stats['min_size'] = DB_POOL_MIN_SIZE
+    stats['max_size'] = DB_POOL_MAX_SIZE
+    return stats
+
+def get_db_pool():
+    """Get the process-wide connection pool, creating it on first use.
+
+    The pool is rebuilt after a fork (gunicorn/celery workers) so that
+    child processes never share sockets with their parent.
+    """
+    global _db_pool, _db_pool_pid
+    pid = os.getpid()
+    if _db_pool is None or _db_pool_pid != pid:
+        with _db_pool_lock:
+            if _db_pool is None or _db_pool_pid != pid:
+                logger.debug(f"Creating database connection pool to {DB_CONFIG['host']} "
+                             f"(min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+                _db_pool = ThreadedConnectionPool(
+                    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+                    connection_factory=PooledConnection, **DB_CONFIG
+                )
+                _db_pool_pid = pid
+    return _db_pool
+
+def get_replica_pool():
+    """Get the read replica connection pool, or None when READ_REPLICA_DSN is unset.
+
+    Rebuilt after a fork, like get_db_pool().
+    """
+    global _replica_pool, _replica_pool_pid
+    if not READ_REPLICA_DSN:
+        return None
+    pid = os.getpid()
+    if _replica_pool is None or _replica_pool_pid != pid:
+        with _db_pool_lock:
+            if _replica_pool is None or _replica_pool_pid != pid:
+                logger.debug(f"Creating read replica connection pool "
+                             f"(min={DB_REPLICA_POOL_MIN_SIZE}, max={DB_REPLICA_POOL_MAX_SIZE})")
+                _replica_pool = ThreadedConnectionPool(
+                    DB_REPLICA_POOL_MIN_SIZE, DB_REPLICA_POOL_MAX_SIZE,
+                    dsn=READ_REPLICA_DSN, connection_factory=PooledConnection
+                )
+                _replica_pool_pid = pid
+    return _replica_pool
+
+def close_db_pool():
+    """Close every pooled connection owned by this process (registered with atexit)."""
+    global _db_pool, _replica_pool
+    with _db_pool_lock:
+        # A forked child must not close sockets inherited from its parent
+        if _db_pool is not None and _db_pool_pid == os.getpid():
+            _db_pool.closeall()
+            logger.debug("Database connection pool closed")
+        if _replica_pool is not None and _replica_pool_pid == os.getpid():
+            _replica_pool.closeall()
+            logger.debug("Read replica connection pool closed")
+        _db_pool = None
+        _replica_pool = None
+
+atexit.register(close_db_pool)
+
 @contextmanager
-def get_db_connection():
-    """Get a database connection with better error handling."""
+def get_db_connection(readonly=False):
+    """Get a pooled database connection with better error handling.
+
+    readonly=True uses the read replica when one is configured; only pass it
+    for reads that tolerate replication lag.
+    """
     conn = None
+    pool = None
     try:
-        logger.debug(f"Attempting database connection to {DB_CONFIG['host']}")
-        conn = psycopg2.connect(**DB_CONFIG)
-        logger.debug("Database connection successful")
+        pool = (get_replica_pool() if readonly else None) or get_db_pool()
+        _count_pool_event('connections_requested')
+        try:
+            conn = pool.getconn()
+        except PoolError:
+            _count_pool_event('connections_exhausted')
+            logger.error(f"Database connection pool exhausted (max={pool.maxconn})")
+            raise
+        _count_pool_event('connections_acquired')
+        logger.debug("Database connection checked out from pool")
         yield conn
     except psycopg2.OperationalError as e:
         logger.error(f"Database connection failed: {e}")
@@ -37,13 +172,21 @@ def get_db_connection():
         raise
     finally:
         if conn is not None:
-            conn.close()
-            logger.debug("Database connection closed")
+            # Discard any uncommitted work so the next borrower starts clean;
+            # broken connections are closed instead of being returned
+            discard = bool(conn.closed)
+            if not discard:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            pool.putconn(conn, close=discard)
+            logger.debug("Database connection returned to pool")
 
 @contextmanager
-def get_db_cursor(commit=False):
-    """Get a database cursor with automatic commit option."""
-    with get_db_connection() as conn:
+def get_db_cursor(commit=False, readonly=False):
+    """Get a database cursor with automatic commit option (readonly: see get_db_connection)."""
+    with get_db_connection(readonly=readonly) as conn:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         try:
             yield cursor
@@ -57,6 +200,19 @@ def get_db_cursor(commit=False):
         finally:
             cursor.close()
 
+def execute_prepared(cursor, name, query, params):
+    """
+    Execute a query as a named server-side prepared statement.
+    The query uses $1, $2, ... placeholders and is PREPAREd once per pooled
+    connection, so later calls skip Postgres parse/plan entirely.
+    """
+    prepared = cursor.connection.prepared_statements
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {query}")
+        prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
 def get_user_by_email(email):
     """Get a user by email with better error handling."""
     if not email:
@@ -310,7 +466,7 @@ def create_database_and_user():
                 CREATE TABLE IF NOT EXISTS user_usage_limits (
                     id SERIAL PRIMARY KEY,
                     user_id INTEGER REFERENCES users(id),
-                    ip_address VARCHAR(45) NOT NULL,
+                    ip_address INET,
                     generations_used INTEGER DEFAULT 0,
                     downloads_used INTEGER DEFAULT 0,
                     last_reset TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
@@ -114,16 +114,21 @@ def run_migration():
             ON user_activities(user_id);
         """)
         
-        # Index on the appropriate timestamp column
+        # Index on the appropriate timestamp column, plus (user_id, timestamp DESC)
+        # so the per-user history page is a backward index scan under LIMIT
         if has_activity_time:
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_user_activities_activity_time 
                 ON user_activities(activity_time);
+                CREATE INDEX IF NOT EXISTS idx_user_activities_user_activity_time
+                ON user_activities(user_id, activity_time DESC);
             """)
         elif has_created_at:
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_user_activities_created_at 
                 ON user_activities(created_at);
+                CREATE INDEX IF NOT EXISTS idx_user_activities_user_created_at
+                ON user_activities(user_id, created_at DESC);
             """)
         
         logger.info("Required indexes created successfully.")
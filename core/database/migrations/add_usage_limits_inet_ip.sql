@@ -0,0 +1,45 @@
+-- Migration: Store user_usage_limits.ip_address as INET
+-- Description: Registered users are tracked by user_id, but ip_address was
+-- NOT NULL, so their rows carried a '0.0.0.0' placeholder. The column is now
+-- a nullable INET (7 bytes for IPv4 vs ~15 for VARCHAR), NULL for registered
+-- users, which also narrows the anonymous (ip_address) indexes.
+-- The partial unique indexes are unchanged: (user_id) WHERE user_id IS NOT NULL
+-- and (ip_address) WHERE user_id IS NULL.
+
+-- Step 1: Drop the placeholder for registered users
+ALTER TABLE user_usage_limits ALTER COLUMN ip_address DROP NOT NULL;
+
+UPDATE user_usage_limits
+SET ip_address = NULL
+WHERE user_id IS NOT NULL;
+
+-- Step 2: Remove anonymous rows that cannot be converted - addresses that do
+-- not parse, and spellings that collapse onto one address once cast (which
+-- would block the unique index rebuild), keeping the most recently reset row
+CREATE OR REPLACE FUNCTION pg_temp.try_inet(value TEXT)
+RETURNS INET AS $$
+BEGIN
+    RETURN value::inet;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DELETE FROM user_usage_limits
+WHERE user_id IS NULL AND pg_temp.try_inet(ip_address) IS NULL;
+
+WITH duplicates AS (
+    SELECT id,
+           ROW_NUMBER() OVER (
+             PARTITION BY pg_temp.try_inet(ip_address)
+             ORDER BY last_reset DESC NULLS LAST, id DESC
+           ) as rn
+    FROM user_usage_limits
+    WHERE user_id IS NULL
+)
+DELETE FROM user_usage_limits
+WHERE id IN (SELECT id FROM duplicates WHERE rn > 1);
+
+-- Step 3: Convert the column (rebuilds the ip_address indexes)
+ALTER TABLE user_usage_limits
+    ALTER COLUMN ip_address TYPE INET USING ip_address::inet;
@@ -0,0 +1,20 @@
+-- Materialize the billing month of last_reset
+-- Limit checks compared EXTRACT(MONTH/YEAR FROM last_reset) against the current
+-- time on every row read. reset_ym stores the month index
+-- (year * 12 + month - 1, UTC) so reads become a single integer equality
+-- against a value computed once by the application.
+-- As a generated column it stays correct for every code path that writes
+-- last_reset.
+
+ALTER TABLE user_usage_limits
+    ADD COLUMN IF NOT EXISTS reset_ym INTEGER
+    GENERATED ALWAYS AS (
+        EXTRACT(YEAR FROM (last_reset AT TIME ZONE 'UTC'))::int * 12
+        + EXTRACT(MONTH FROM (last_reset AT TIME ZONE 'UTC'))::int - 1
+    ) STORED;
+
+-- No covering indexes on the counters: every increment changes generations_used
+-- and last_reset, and an index that includes them rules out HOT updates. Limit
+-- checks use the partial unique indexes on ip_address / user_id.
+DROP INDEX IF EXISTS idx_user_usage_limits_anonymous_covering;
+DROP INDEX IF EXISTS idx_user_usage_limits_registered_covering;
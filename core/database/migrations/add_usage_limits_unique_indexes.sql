@@ -0,0 +1,44 @@
+-- Migration: Ensure the partial unique indexes on user_usage_limits exist
+-- Description: check_user_limits and the increment_usage upserts look rows up
+-- by (user_id) WHERE user_id IS NOT NULL or (ip_address) WHERE user_id IS NULL.
+-- The ON CONFLICT clauses need these exact partial unique indexes as arbiters;
+-- databases created before they were added to schema.sql fall back to
+-- sequential scans (and the upserts fail outright).
+--
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block: run this
+-- file with psql in autocommit mode (the default), not with --single-transaction.
+
+-- Step 1: Remove duplicate rows that would block the unique indexes,
+-- keeping the most recently reset row per key
+WITH duplicates AS (
+    SELECT id,
+           ROW_NUMBER() OVER (
+             PARTITION BY user_id
+             ORDER BY last_reset DESC NULLS LAST, id DESC
+           ) as rn
+    FROM user_usage_limits
+    WHERE user_id IS NOT NULL
+)
+DELETE FROM user_usage_limits
+WHERE id IN (SELECT id FROM duplicates WHERE rn > 1);
+
+WITH duplicates AS (
+    SELECT id,
+           ROW_NUMBER() OVER (
+             PARTITION BY ip_address
+             ORDER BY last_reset DESC NULLS LAST, id DESC
+           ) as rn
+    FROM user_usage_limits
+    WHERE user_id IS NULL
+)
+DELETE FROM user_usage_limits
+WHERE id IN (SELECT id FROM duplicates WHERE rn > 1);
+
+-- Step 2: Build the indexes without blocking writes (no-op where they exist)
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_user_usage_limits_registered
+    ON user_usage_limits(user_id)
+    WHERE user_id IS NOT NULL;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_user_usage_limits_anonymous
+    ON user_usage_limits(ip_address)
+    WHERE user_id IS NULL;
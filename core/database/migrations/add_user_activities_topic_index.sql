@@ -0,0 +1,12 @@
+-- User Activities Topic/Type Index
+-- On schemas without content_hash, save_history_item looks for a recent entry
+-- of the same lesson by (user_id, lessonTopic, resourceType) before updating
+-- or inserting. Indexing the extracted JSONB fields lets that lookup seek
+-- instead of filtering every history row of the user.
+-- CONCURRENTLY avoids blocking history writes; run outside a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_activities_user_topic_type
+    ON user_activities(user_id, (lesson_data->>'lessonTopic'), (lesson_data->>'resourceType'));
+
+-- Refresh planner statistics for the expression columns
+ANALYZE user_activities;
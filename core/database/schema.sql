@@ -66,10 +66,16 @@ CREATE TABLE IF NOT EXISTS user_tiers (
 CREATE TABLE IF NOT EXISTS user_usage_limits (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id),
-    ip_address VARCHAR(45) NOT NULL,
+    -- UPDATED: INET, NULL for registered users (tracked by user_id)
+    ip_address INET,
     generations_used INTEGER DEFAULT 0,
     downloads_used INTEGER DEFAULT 0,
     last_reset TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- ADDED: Billing month of last_reset (year * 12 + month - 1, UTC)
+    reset_ym INTEGER GENERATED ALWAYS AS (
+        EXTRACT(YEAR FROM (last_reset AT TIME ZONE 'UTC'))::int * 12
+        + EXTRACT(MONTH FROM (last_reset AT TIME ZONE 'UTC'))::int - 1
+    ) STORED,
     -- ADDED: Hourly tracking fields
     hourly_generations INTEGER DEFAULT 0,
     last_hourly_reset TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
@@ -94,6 +100,7 @@ CREATE TABLE IF NOT EXISTS user_subscriptions (
 CREATE INDEX IF NOT EXISTS idx_user_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_user_activities_user_id ON user_activities(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_activities_created_at ON user_activities(created_at);
+CREATE INDEX IF NOT EXISTS idx_user_activities_user_created_at ON user_activities(user_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_user_logins_user_id ON user_logins(user_id);
 CREATE INDEX IF NOT EXISTS idx_anonymous_ip ON anonymous_usage(ip_address);
 CREATE INDEX IF NOT EXISTS idx_user_tier ON users(tier_id);
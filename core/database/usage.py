@@ -1,25 +1,44 @@
 # core/database/usage.py - IMPROVED VERSION with clear separation of user vs IP tracking
 import os
+import time
 import logging
-import traceback
-from datetime import datetime, timedelta
-from .database import get_db_cursor, get_db_connection        
-from config.settings import logger
+import ipaddress
+import threading
+from functools import lru_cache
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from .database import get_db_cursor, get_db_connection, execute_prepared
+from core.services.redis_client import get_redis_client, mark_redis_unavailable
 
 logger = logging.getLogger(__name__)
 
-# FIXED: Correct limits as requested
+# FIXED: Correct limits as requested. Free-tier monthly limits are read from
+# the environment once at import; call reload_limits() after changing them.
+MONTHLY_GENERATION_LIMIT = 10
+MONTHLY_DOWNLOAD_LIMIT = 10
+
+def reload_limits():
+    """(Re)load the free-tier monthly limits from the environment."""
+    global MONTHLY_GENERATION_LIMIT, MONTHLY_DOWNLOAD_LIMIT, _FREE_LIMIT_PARAMS, _NO_USAGE_RESULT
+    MONTHLY_GENERATION_LIMIT = int(os.environ.get('FREE_MONTHLY_GENERATION_LIMIT', '10'))
+    MONTHLY_DOWNLOAD_LIMIT = int(os.environ.get('FREE_MONTHLY_DOWNLOAD_LIMIT', '10'))
+    _FREE_LIMIT_PARAMS = (MONTHLY_GENERATION_LIMIT, MONTHLY_DOWNLOAD_LIMIT)
+    # Updated in place - usage_v2.TIER_LIMITS['free'] is this same dict
+    FREE_TIER_LIMITS['monthly_generations'] = MONTHLY_GENERATION_LIMIT
+    FREE_TIER_LIMITS['monthly_downloads'] = MONTHLY_DOWNLOAD_LIMIT
+    _NO_USAGE_RESULT = UsageResult(True, True, MONTHLY_GENERATION_LIMIT, MONTHLY_DOWNLOAD_LIMIT, None, 0, 0, 'free')
+
 def get_generation_limit(tier='free'):
     """Get generation limit based on tier"""
     if tier == 'premium':
         return -1  # Unlimited
-    return 10  # Free tier: 10 per month
+    return MONTHLY_GENERATION_LIMIT  # Free tier: per month
 
 def get_download_limit(tier='free'):
     """Get download limit based on tier"""
     if tier == 'premium':
         return -1  # Unlimited
-    return 10  # Free tier: 10 per month
+    return MONTHLY_DOWNLOAD_LIMIT  # Free tier: per month
 
 # UPDATED: New hourly limits
 HOURLY_LIMITS = {
@@ -27,6 +46,235 @@ HOURLY_LIMITS = {
     'premium': 15   # Premium users: 15 generations per hour
 }
 
+# Free-tier limits as enforced by UsageTracker (usage_v2.TIER_LIMITS['free']);
+# the monthly entries are filled in by reload_limits()
+FREE_TIER_LIMITS = {
+    'monthly_generations': MONTHLY_GENERATION_LIMIT,
+    'monthly_downloads': MONTHLY_DOWNLOAD_LIMIT,
+    'hourly_generations': HOURLY_LIMITS['free']
+}
+
+class UsageResult(namedtuple('UsageResult', [
+    'can_generate', 'can_download', 'generations_left', 'downloads_left',
+    'reset_time', 'generations_used', 'downloads_used', 'user_tier'
+])):
+    """Flat, immutable result of a limits check; use to_dict() at the JSON boundary."""
+    __slots__ = ()
+
+    @property
+    def is_premium(self):
+        return self.user_tier == 'premium'
+
+    def to_dict(self):
+        """Response shape returned by check_user_limits."""
+        return {
+            'can_generate': self.can_generate,
+            'can_download': self.can_download,
+            'generations_left': self.generations_left,
+            'downloads_left': self.downloads_left,
+            'reset_time': self.reset_time,
+            'current_usage': {
+                'generations_used': self.generations_used,
+                'downloads_used': self.downloads_used
+            },
+            'user_tier': self.user_tier,
+            'is_premium': self.user_tier == 'premium'
+        }
+
+# Premium quotas are unlimited (999999 to clients)
+UNLIMITED = 999999
+
+# Prebuilt results for the fixed-shape branches; callers _replace() in the
+# reset_time (and usage/tier where it varies). _NO_USAGE_RESULT is built by
+# reload_limits() since it carries the free-tier limits.
+_PREMIUM_RESULT = UsageResult(True, True, UNLIMITED, UNLIMITED, None, 0, 0, 'premium')
+_DENIED_RESULT = UsageResult(False, False, 0, 0, None, 0, 0, 'free')
+
+# Monthly reset ISO string, memoized per month index (year * 12 + month - 1)
+_RESET_CACHE = {}
+
+def _month_index(dt):
+    """Months since year 0 - two datetimes share a billing month iff these match."""
+    return dt.year * 12 + dt.month - 1
+
+def _current_month_index():
+    """Month index for the current UTC time, read from time.gmtime() (no datetime/tz objects)."""
+    now = time.gmtime()
+    return now.tm_year * 12 + now.tm_mon - 1
+
+def get_monthly_reset_time(now=None):
+    """Get the start of next month (UTC), when monthly limits reset."""
+    now = now or datetime.now(timezone.utc)
+    year, month = divmod(_month_index(now) + 1, 12)
+    return datetime(year, month + 1, 1, tzinfo=timezone.utc)
+
+def _cached_reset_iso():
+    """Get the monthly reset time as an ISO string, recomputed once per month."""
+    key = _current_month_index()
+    reset_iso = _RESET_CACHE.get(key)
+    if reset_iso is None:
+        year, month = divmod(key + 1, 12)
+        reset_iso = datetime(year, month + 1, 1, tzinfo=timezone.utc).isoformat()
+        _RESET_CACHE.clear()
+        _RESET_CACHE[key] = reset_iso
+    return reset_iso
+
+# Hourly counters live in Redis when available (INCR with a 1-hour TTL);
+# the hourly_generations columns remain the fallback when Redis is down
+HOURLY_WINDOW_SECONDS = 3600
+
+def _hourly_counter_key(user_id, ip_address):
+    """Redis key for the hourly generation counter of a user or anonymous IP."""
+    if user_id:
+        return f"usage:hourly:user:{user_id}"
+    return f"usage:hourly:ip:{ip_address}"
+
+# Usage upsert covering the monthly counters and the hourly generation window
+# in one write. Both tracking modes share one statement and differ only in the
+# partial unique index they conflict on; registered users have a NULL
+# ip_address. Parameters: (user_id, ip_address, gen_delta, dl_delta,
+# gen_delta, current month index) - hourly_generations only counts
+# generations, and the monthly rollover compares the UTC reset_ym column with
+# _current_month_index() exactly as the reads do.
+_INCREMENT_USAGE_SQL_TEMPLATE = """
+    INSERT INTO user_usage_limits 
+      (user_id, ip_address, generations_used, downloads_used, hourly_generations,
+       last_reset, last_hourly_reset)
+    VALUES {values}
+    ON CONFLICT {conflict_target} DO UPDATE 
+    SET 
+      generations_used = CASE 
+        WHEN user_usage_limits.reset_ym IS DISTINCT FROM $6
+          THEN EXCLUDED.generations_used
+        ELSE user_usage_limits.generations_used + EXCLUDED.generations_used
+      END,
+      downloads_used = CASE 
+        WHEN user_usage_limits.reset_ym IS DISTINCT FROM $6
+          THEN EXCLUDED.downloads_used
+        ELSE user_usage_limits.downloads_used + EXCLUDED.downloads_used
+      END,
+      hourly_generations = CASE
+        WHEN user_usage_limits.last_hourly_reset IS NULL
+          OR user_usage_limits.last_hourly_reset <= CURRENT_TIMESTAMP - INTERVAL '1 hour'
+          THEN EXCLUDED.hourly_generations
+        ELSE COALESCE(user_usage_limits.hourly_generations, 0) + EXCLUDED.hourly_generations
+      END,
+      last_hourly_reset = CASE
+        WHEN user_usage_limits.last_hourly_reset IS NULL
+          OR user_usage_limits.last_hourly_reset <= CURRENT_TIMESTAMP - INTERVAL '1 hour'
+          THEN CURRENT_TIMESTAMP
+        ELSE user_usage_limits.last_hourly_reset
+      END,
+      last_reset = CURRENT_TIMESTAMP
+"""
+_USAGE_CONFLICT_TARGETS = {
+    'user_id': "(user_id) WHERE user_id IS NOT NULL",
+    'ip_address': "(ip_address) WHERE user_id IS NULL",
+}
+# Single-row form, run as the prepared statement increment_usage_<mode>; it
+# returns the post-increment hourly count, so the write also answers the
+# hourly limit check
+_INCREMENT_USAGE_SQL = {
+    mode: _INCREMENT_USAGE_SQL_TEMPLATE.format(
+        values="($1, $2, $3, $4, $5, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)", conflict_target=target
+    ) + "    RETURNING hourly_generations\n"
+    for mode, target in _USAGE_CONFLICT_TARGETS.items()
+}
+# Hourly window rollover + read for check_and_reset_hourly_limits (prepared)
+_HOURLY_CHECK_SQL_TEMPLATE = """
+    UPDATE user_usage_limits
+    SET hourly_generations = CASE
+          WHEN last_hourly_reset IS NULL
+            OR last_hourly_reset <= CURRENT_TIMESTAMP - INTERVAL '1 hour'
+            THEN 0
+          ELSE hourly_generations
+        END,
+        last_hourly_reset = CASE
+          WHEN last_hourly_reset IS NULL
+            OR last_hourly_reset <= CURRENT_TIMESTAMP - INTERVAL '1 hour'
+            THEN CURRENT_TIMESTAMP
+          ELSE last_hourly_reset
+        END
+    WHERE {where}
+    RETURNING hourly_generations
+"""
+_HOURLY_CHECK_SQL = {
+    'user_id': _HOURLY_CHECK_SQL_TEMPLATE.format(where="user_id = $1"),
+    'ip_address': _HOURLY_CHECK_SQL_TEMPLATE.format(where="user_id IS NULL AND ip_address = $1"),
+}
+
+# Subscription lookups for get_user_subscription_tier cache misses (prepared)
+_TIER_BY_ID_SQL = "SELECT subscription_tier, subscription_status FROM users WHERE id = $1"
+_TIER_BY_EMAIL_SQL = "SELECT subscription_tier, subscription_status FROM users WHERE email = $1"
+
+# Monthly usage reads for check_user_limits, run as server-side prepared
+# statements (see execute_prepared) so Postgres skips parse/plan per call.
+# $2/$3 are the free-tier monthly limits; Postgres returns the remaining
+# quota and can_* flags directly (premium responses ignore them).
+# $4 is the current month index, compared with the generated reset_ym column.
+_MONTHLY_USAGE_COLUMNS = """
+      CASE WHEN reset_ym = $4 THEN COALESCE(generations_used, 0) ELSE 0 END AS current_generations_used,
+      CASE WHEN reset_ym = $4 THEN COALESCE(downloads_used, 0) ELSE 0 END AS current_downloads_used,
+      last_reset"""
+_LIMIT_COLUMNS = """
+      GREATEST(0, $2 - current_generations_used) AS generations_left,
+      current_generations_used < $2 AS can_generate,
+      GREATEST(0, $3 - current_downloads_used) AS downloads_left,
+      current_downloads_used < $3 AS can_download"""
+# Registered users: the tier comes from users in the same round-trip, and the
+# LEFT JOIN still yields a row (zero usage) before the first increment
+_USAGE_BY_USER_SQL = f"""
+    SELECT monthly.*, {_LIMIT_COLUMNS}
+    FROM (
+      SELECT {_MONTHLY_USAGE_COLUMNS},
+        u.subscription_tier,
+        u.subscription_status,
+        user_usage_limits.user_id IS NOT NULL AS has_usage
+      FROM users u
+      LEFT JOIN user_usage_limits ON user_usage_limits.user_id = u.id
+      WHERE u.id = $1
+    ) AS monthly
+"""
+_USAGE_BY_IP_SQL = f"""
+    SELECT monthly.*, {_LIMIT_COLUMNS}
+    FROM (
+      SELECT {_MONTHLY_USAGE_COLUMNS}
+      FROM user_usage_limits
+      WHERE user_id IS NULL AND ip_address = $1
+    ) AS monthly
+"""
+reload_limits()  # sets _FREE_LIMIT_PARAMS and _NO_USAGE_RESULT
+
+# Subscription status changes rarely; cache (expires_at, tier) per user id/email,
+# evicting least recently used entries past the cap. Call
+# invalidate_subscription_tier() when a user's subscription changes.
+SUBSCRIPTION_TIER_CACHE_TTL = 300
+SUBSCRIPTION_TIER_CACHE_MAX_SIZE = 10000
+
+_subscription_tier_cache = OrderedDict()
+_subscription_tier_cache_lock = threading.Lock()
+
+# Redis is the shared L2 behind that cache (per user id, across workers).
+# Invalidations are published so every worker drops its L1 entry too.
+SUBSCRIPTION_TIER_REDIS_TTL = 900
+TIER_INVALIDATION_CHANNEL = 'tier_invalidations'
+
+_tier_listener = None
+_tier_listener_lock = threading.Lock()
+
+# Tier claims stored in the signed session cookie by /auth/check are trusted
+# for this long, so the decorators can skip the users lookup entirely
+SESSION_TIER_TTL = 300
+
+# Short-lived in-process cache for check_user_limits, keyed on the tracked
+# identity. Staleness of a second or two is invisible to users and absorbs
+# bursts of limit checks from the same client.
+LIMITS_CACHE_TTL = 1.5
+LIMITS_CACHE_MAX_SIZE = 10000
+
+_limits_cache = OrderedDict()
+_limits_cache_lock = threading.Lock()
+
 def sanitize_ip_address(ip_address):
     """Sanitize the IP address input."""
     if ip_address is None:
@@ -35,404 +283,454 @@ def sanitize_ip_address(ip_address):
     if isinstance(ip_address, tuple):
         ip_address = ip_address[0]
 
-    ip_address = str(ip_address).strip()
-    
-    if ':' in ip_address:
-        ip_address = ip_address.split(':')[0]
+    return _normalize_ip(str(ip_address))
+
+@lru_cache(maxsize=4096)
+def _normalize_ip(ip_address):
+    """Strip any port and canonicalize an address string (memoized - clients repeat)."""
+    ip_address = ip_address.strip()
+
+    if ip_address.startswith('['):
+        # Bracketed IPv6, optionally with a port: [::1]:8080
+        ip_address = ip_address[1:].split(']', 1)[0]
+    elif ip_address.count(':') == 1:
+        # A single colon is an IPv4 address with a port; IPv6 has several
+        ip_address = ip_address.split(':', 1)[0]
 
     try:
-        import ipaddress
-        ipaddress.ip_address(ip_address)
-        return ip_address
+        # Always parse (the lru_cache keeps this cheap): it range-checks IPv4
+        # and gives the canonical form so equivalent IPv6 spellings share one row
+        parsed = ipaddress.ip_address(ip_address)
     except ValueError:
+        # ip_address is an INET column - an unparseable value cannot be tracked
         logger.warning(f"Invalid IP address format: {ip_address}")
-        return ip_address
+        return None
+
+    if getattr(parsed, 'scope_id', None):
+        # Scoped IPv6 (fe80::1%eth0) is not a valid INET value
+        logger.warning(f"Scoped IP address not accepted: {ip_address}")
+        return None
+    return parsed.compressed
 
-def get_user_subscription_tier(user_id, user_email=None):
+def make_tier_claim(user_id, tier):
+    """Build a session tier claim for user_id that expires after SESSION_TIER_TTL seconds."""
+    return {'user_id': user_id, 'tier': tier, 'exp': time.time() + SESSION_TIER_TTL}
+
+def tier_from_claim(claim, user_id):
+    """Get the tier from a session tier claim, or None if missing, expired or for another user."""
+    if not claim or claim.get('user_id') != user_id or claim.get('exp', 0) <= time.time():
+        return None
+    return claim.get('tier')
+
+def get_user_subscription_tier(user_id, user_email=None, cached_tier=None):
     """
     Get user's subscription tier. Returns 'free' or 'premium'.
     Only checks user table, never IP-based records.
+    cached_tier (from an unexpired session claim) is returned as-is; otherwise
+    results are cached in-process for SUBSCRIPTION_TIER_CACHE_TTL seconds.
     """
     # Default to free for anonymous users
     if not user_id and not user_email:
         logger.debug("No user_id or email provided - returning free tier")
         return 'free'
-    
+
+    if cached_tier:
+        return cached_tier
+
+    cache_key = _subscription_tier_cache_key(user_id, user_email)
+    with _subscription_tier_cache_lock:
+        cached = _subscription_tier_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            _subscription_tier_cache.move_to_end(cache_key)
+            return cached[1]
+
+    redis_client = get_redis_client() if user_id else None
+    if redis_client is not None:
+        _ensure_tier_listener()
+        try:
+            tier = redis_client.get(_subscription_tier_redis_key(user_id))
+            if tier:
+                _store_subscription_tier(cache_key, tier)
+                return tier
+        except Exception as e:
+            logger.warning(f"Redis tier lookup failed, falling back to Postgres: {e}")
+            mark_redis_unavailable()
+            redis_client = None
+
     try:
-        with get_db_cursor() as cursor:
-            # FIXED: Check the users table for subscription info
+        # Tier changes already take minutes to reach every cache; replica lag is noise
+        with get_db_cursor(readonly=True) as cursor:
+            # FIXED: Check the users table for subscription info - by id when we
+            # have it, otherwise by email; either way a single lookup
             if user_id:
-                cursor.execute("""
-                    SELECT subscription_tier, subscription_status 
-                    FROM users 
-                    WHERE id = %s
-                """, (user_id,))
-                
-                result = cursor.fetchone()
-                if result:
-                    tier = result.get('subscription_tier', 'free')
-                    status = result.get('subscription_status', 'inactive')
-                    
-                    logger.debug(f"User {user_id} has tier: {tier}, status: {status}")
-                    
-                    if tier == 'premium' and status == 'active':
-                        logger.info(f"User {user_id} has active premium subscription")
-                        return 'premium'
-                    else:
-                        logger.info(f"User {user_id} has {tier} subscription with status {status}")
-                        return 'free'
+                execute_prepared(cursor, 'tier_by_id', _TIER_BY_ID_SQL, (user_id,))
+            else:
+                execute_prepared(cursor, 'tier_by_email', _TIER_BY_EMAIL_SQL, (user_email,))
             
-            # Check by email if we have it and no user_id
-            if user_email and not user_id:
-                cursor.execute("""
-                    SELECT subscription_tier, subscription_status 
-                    FROM users 
-                    WHERE email = %s
-                """, (user_email,))
-                
-                result = cursor.fetchone()
-                if result:
-                    tier = result.get('subscription_tier', 'free')
-                    status = result.get('subscription_status', 'inactive')
-                    
-                    logger.debug(f"User {user_email} has tier: {tier}, status: {status}")
-                    
-                    if tier == 'premium' and status == 'active':
-                        logger.info(f"User {user_email} has active premium subscription")
-                        return 'premium'
-        
-        logger.debug(f"User {'ID ' + str(user_id) if user_id else 'email ' + str(user_email)} defaulting to free subscription")
-        return 'free'
+            result = cursor.fetchone()
+
+        if result:
+            tier = resolve_subscription_tier(result.get('subscription_tier'), result.get('subscription_status'))
+            logger.info(f"User {cache_key} has {result.get('subscription_tier')} subscription with status {result.get('subscription_status')}")
+        else:
+            tier = 'free'
+            logger.debug(f"User {'ID ' + str(user_id) if user_id else 'email ' + str(user_email)} defaulting to free subscription")
+
+        _store_subscription_tier(cache_key, tier)
+        if redis_client is not None:
+            try:
+                redis_client.set(_subscription_tier_redis_key(user_id), tier, ex=SUBSCRIPTION_TIER_REDIS_TTL)
+            except Exception as e:
+                logger.warning(f"Redis tier store failed: {e}")
+                mark_redis_unavailable()
+        return tier
         
     except Exception as e:
         logger.error(f"Error checking subscription tier: {e}")
         return 'free'
 
+def resolve_subscription_tier(subscription_tier, subscription_status):
+    """Map raw subscription columns to the effective tier ('free' or 'premium')."""
+    if subscription_tier == 'premium' and subscription_status == 'active':
+        return 'premium'
+    return 'free'
+
+def _subscription_tier_cache_key(user_id, user_email):
+    """L1 cache key - ids are stringified so pub/sub invalidations match them."""
+    return str(user_id) if user_id else user_email
+
+def _subscription_tier_redis_key(user_id):
+    """Redis (L2) key for a user's effective tier."""
+    return f"tier:user:{user_id}"
+
+def _store_subscription_tier(cache_key, tier):
+    """Cache a tier in-process, evicting the least recently used entries past the cap."""
+    with _subscription_tier_cache_lock:
+        _subscription_tier_cache[cache_key] = (time.monotonic() + SUBSCRIPTION_TIER_CACHE_TTL, tier)
+        _subscription_tier_cache.move_to_end(cache_key)
+        while len(_subscription_tier_cache) > SUBSCRIPTION_TIER_CACHE_MAX_SIZE:
+            _subscription_tier_cache.popitem(last=False)
+
+def _peek_subscription_tier(user_id):
+    """Get a user's tier from the in-process cache only (None on a miss)."""
+    cache_key = _subscription_tier_cache_key(user_id, None)
+    with _subscription_tier_cache_lock:
+        cached = _subscription_tier_cache.get(cache_key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def _drop_local_subscription_tier(*cache_keys):
+    """Remove tier entries from this process's cache."""
+    with _subscription_tier_cache_lock:
+        for key in cache_keys:
+            if key:
+                _subscription_tier_cache.pop(key, None)
+
+def invalidate_subscription_tier(user_id=None, user_email=None):
+    """
+    Drop cached tier (and limits) for a user so a subscription change applies
+    immediately - locally, in Redis, and in other workers via pub/sub.
+    """
+    _drop_local_subscription_tier(_subscription_tier_cache_key(user_id, None), user_email)
+    if not user_id:
+        return
+    invalidate_cached_limits(user_id=user_id)
+
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.delete(_subscription_tier_redis_key(user_id))
+        pipe.publish(TIER_INVALIDATION_CHANNEL, str(user_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis tier invalidation failed: {e}")
+        mark_redis_unavailable()
+
+def _ensure_tier_listener():
+    """Start the tier invalidation subscriber (again after a fork) if it is not running."""
+    global _tier_listener
+    if _tier_listener is not None and _tier_listener.is_alive():
+        return
+    with _tier_listener_lock:
+        if _tier_listener is None or not _tier_listener.is_alive():
+            _tier_listener = threading.Thread(target=_run_tier_listener, name='tier-invalidations', daemon=True)
+            _tier_listener.start()
+
+def _run_tier_listener():
+    """Drop L1 tier entries as invalidations are published by any worker."""
+    while True:
+        redis_client = get_redis_client()
+        if redis_client is None:
+            time.sleep(SUBSCRIPTION_TIER_CACHE_TTL)
+            continue
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(TIER_INVALIDATION_CHANNEL)
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    _drop_local_subscription_tier(message['data'])
+        except Exception as e:
+            logger.warning(f"Tier invalidation subscriber failed, reconnecting: {e}")
+            time.sleep(1)
+
 def increment_usage(ip_address=None, user_id=None, action_type='generation'):
     """
     IMPROVED: Increment usage with clear separation between user and IP tracking.
     - If user_id is provided: track by user_id only, ignore ip_address for tracking
     - If no user_id: track by ip_address only (anonymous users)
+    Returns the hourly generation count after a generation (compare it to
+    HOURLY_LIMITS[tier]) when Redis or the direct write provides it, else None.
     """
     logger.info(f"Incrementing {action_type} usage for {'user ' + str(user_id) if user_id else 'IP ' + str(ip_address)}")
 
     try:
-        # Get user's subscription tier (only matters for registered users)
-        user_tier = get_user_subscription_tier(user_id, None) if user_id else 'free'
-        logger.info(f"User tier: {user_tier}")
-        
-        # For premium users with unlimited generations, still track for analytics but note unlimited
-        if user_tier == 'premium' and action_type == 'generation':
-            logger.info("Premium user - tracking for analytics but no limits enforced")
-        
+        # Tier is not needed here: premium usage is still tracked for analytics,
+        # and limit checks read the tier from users.
+        # Resolve the per-action deltas once so Postgres binds plain integers
+        gen_delta = 1 if action_type == 'generation' else 0
+        dl_delta = 1 if action_type == 'download' else 0
+
+        if user_id:
+            # REGISTERED USER: Track by user_id only, no IP stored
+            logger.debug(f"Tracking usage for registered user {user_id}")
+            mode = 'user_id'
+            params = (user_id, None, gen_delta, dl_delta)
+        else:
+            # ANONYMOUS USER: Track by IP only
+            ip_address = sanitize_ip_address(ip_address)
+            if not ip_address:
+                raise ValueError("IP address is required for anonymous users")
+
+            logger.debug(f"Tracking usage for anonymous IP {ip_address}")
+            mode = 'ip_address'
+            params = (None, ip_address, gen_delta, dl_delta)
+
+        hourly_used = bump_and_get_hourly(user_id, ip_address) if gen_delta else None
+
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                if user_id:
-                    # REGISTERED USER: Track by user_id only, use placeholder IP
-                    logger.debug(f"Tracking usage for registered user {user_id}")
-                    cursor.execute("""
-                        INSERT INTO user_usage_limits 
-                          (user_id, ip_address, generations_used, downloads_used, last_reset)
-                        VALUES 
-                          (%s, '0.0.0.0', 
-                           CASE WHEN %s = 'generation' THEN 1 ELSE 0 END, 
-                           CASE WHEN %s = 'download' THEN 1 ELSE 0 END, 
-                           CURRENT_TIMESTAMP)
-                        ON CONFLICT (user_id) WHERE user_id IS NOT NULL DO UPDATE 
-                        SET 
-                          generations_used = CASE 
-                            WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              THEN CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                            ELSE user_usage_limits.generations_used + CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                          END,
-                          downloads_used = CASE 
-                            WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              THEN CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                            ELSE user_usage_limits.downloads_used + CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                          END,
-                          last_reset = CURRENT_TIMESTAMP,
-                          ip_address = '0.0.0.0'  -- Always use placeholder for registered users
-                    """, (
-                        user_id,
-                        action_type, action_type,
-                        action_type, action_type,
-                        action_type, action_type
-                    ))
-                else:
-                    # ANONYMOUS USER: Track by IP only
-                    ip_address = sanitize_ip_address(ip_address)
-                    if not ip_address:
-                        raise ValueError("IP address is required for anonymous users")
-                    
-                    logger.debug(f"Tracking usage for anonymous IP {ip_address}")
-                    cursor.execute("""
-                        INSERT INTO user_usage_limits 
-                          (user_id, ip_address, generations_used, downloads_used, last_reset)
-                        VALUES 
-                          (NULL, %s, 
-                           CASE WHEN %s = 'generation' THEN 1 ELSE 0 END, 
-                           CASE WHEN %s = 'download' THEN 1 ELSE 0 END, 
-                           CURRENT_TIMESTAMP)
-                        ON CONFLICT (ip_address) WHERE user_id IS NULL DO UPDATE 
-                        SET 
-                          generations_used = CASE 
-                            WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              THEN CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                            ELSE user_usage_limits.generations_used + CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                          END,
-                          downloads_used = CASE 
-                            WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              THEN CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                            ELSE user_usage_limits.downloads_used + CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                          END,
-                          last_reset = CURRENT_TIMESTAMP
-                    """, (
-                        ip_address,
-                        action_type, action_type,
-                        action_type, action_type,
-                        action_type, action_type
-                    ))
+                execute_prepared(cursor, f'increment_usage_{mode}', _INCREMENT_USAGE_SQL[mode], (*params, gen_delta, _current_month_index()))
+                row = cursor.fetchone()
             
             conn.commit()
-            logger.info(f"Successfully incremented {action_type} usage for {user_tier} {'user' if user_id else 'anonymous'}")
+            invalidate_cached_limits(user_id, ip_address)
+            logger.info(f"Successfully incremented {action_type} usage for {'user' if user_id else 'anonymous'}")
+
+        if gen_delta and hourly_used is None and row:
+            hourly_used = row[0]
+        return hourly_used
     except Exception as e:
-        logger.error(f"Error incrementing usage: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error incrementing usage: {e}")
         raise
 
-def check_user_limits(user_id=None, ip_address=None):
+def check_user_limits(user_id=None, ip_address=None, cached_tier=None):
     """
     IMPROVED: Check usage limits with clear separation.
     - If user_id provided: check user-based limits only
     - If no user_id: check IP-based limits only
+    Returns the response dict; internal callers can use get_usage_result()
+    to skip building it.
     """
-    logger.info(f"Checking limits for {'user ' + str(user_id) if user_id else 'IP ' + str(ip_address)}")
+    return get_usage_result(user_id, ip_address, cached_tier).to_dict()
 
-    # Get user's subscription tier
-    user_tier = get_user_subscription_tier(user_id, None) if user_id else 'free'
-    logger.info(f"Checking limits for {user_tier} tier")
+def get_usage_result(user_id=None, ip_address=None, cached_tier=None):
+    """
+    Check usage limits and return a UsageResult.
+    Results are cached in-process for LIMITS_CACHE_TTL seconds to absorb bursts;
+    increment_usage invalidates the entry it touches.
+    Users known to be premium (cached_tier from a session claim, or the
+    in-process tier cache) get the unlimited result without a query; their
+    usage counts are not read on that path.
+    """
+    logger.info(f"Checking limits for {'user ' + str(user_id) if user_id else 'IP ' + str(ip_address)}")
 
     try:
-        with get_db_cursor() as cursor:
-            if user_id:
-                # REGISTERED USER: Check by user_id only
-                query = """
-                SELECT 
-                  CASE 
-                    WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                      OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                      OR last_reset IS NULL
-                      THEN 0 
-                    ELSE COALESCE(generations_used, 0) 
-                  END AS current_generations_used,
-                  CASE 
-                    WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                      OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                      OR last_reset IS NULL
-                      THEN 0 
-                    ELSE COALESCE(downloads_used, 0) 
-                  END AS current_downloads_used,
-                  last_reset
-                FROM user_usage_limits
-                WHERE user_id = %s
-                """
-                params = (user_id,)
-                logger.debug(f"Checking limits for registered user {user_id}")
-            else:
-                # ANONYMOUS USER: Check by IP only
-                ip_address = sanitize_ip_address(ip_address)
-                if not ip_address:
-                    raise ValueError("IP address is required for anonymous users")
-                
-                query = """
-                SELECT 
-                  CASE 
-                    WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                      OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                      OR last_reset IS NULL
-                      THEN 0 
-                    ELSE COALESCE(generations_used, 0) 
-                  END AS current_generations_used,
-                  CASE 
-                    WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                      OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                      OR last_reset IS NULL
-                      THEN 0 
-                    ELSE COALESCE(downloads_used, 0) 
-                  END AS current_downloads_used,
-                  last_reset
-                FROM user_usage_limits
-                WHERE user_id IS NULL AND ip_address = %s
-                """
-                params = (ip_address,)
-                logger.debug(f"Checking limits for anonymous IP {ip_address}")
-
-            cursor.execute(query, params)
-            usage = cursor.fetchone()
-
-            # Get limits based on tier
-            gen_limit = get_generation_limit(user_tier)
-            dl_limit = get_download_limit(user_tier)
-
-            if not usage:
-                # No usage record found
-                logger.info("No usage record found - within limits")
-                return {
-                    'can_generate': True,
-                    'can_download': True,
-                    'generations_left': gen_limit if gen_limit > 0 else 999999,
-                    'downloads_left': dl_limit if dl_limit > 0 else 999999,
-                    'reset_time': datetime(2025, 2, 1).isoformat(),
-                    'current_usage': {
-                        'generations_used': 0,
-                        'downloads_used': 0
-                    },
-                    'user_tier': user_tier,
-                    'is_premium': user_tier == 'premium'
-                }
-
-            current_generations = usage.get('current_generations_used', 0)
-            current_downloads = usage.get('current_downloads_used', 0)
-            
-            # Calculate remaining limits
-            if gen_limit == -1:  # Unlimited for premium
-                generations_left = 999999
-                can_generate = True
-            else:
-                generations_left = max(0, gen_limit - current_generations)
-                can_generate = generations_left > 0
-            
-            if dl_limit == -1:  # Unlimited for premium
-                downloads_left = 999999
-                can_download = True
-            else:
-                downloads_left = max(0, dl_limit - current_downloads)
-                can_download = downloads_left > 0
-
-            logger.info(f"Current usage: {current_generations}/{gen_limit if gen_limit > 0 else 'unlimited'} generations, {current_downloads}/{dl_limit if dl_limit > 0 else 'unlimited'} downloads")
-
-            return {
-                'can_generate': can_generate,
-                'can_download': can_download,
-                'generations_left': generations_left,
-                'downloads_left': downloads_left,
-                'reset_time': datetime(2025, 2, 1).isoformat(),
-                'current_usage': {
-                    'generations_used': current_generations,
-                    'downloads_used': current_downloads
-                },
-                'user_tier': user_tier,
-                'is_premium': user_tier == 'premium'
-            }
+        if user_id and (cached_tier or _peek_subscription_tier(user_id)) == 'premium':
+            logger.debug(f"Premium fast path for user {user_id}")
+            return _PREMIUM_RESULT._replace(reset_time=_cached_reset_iso())
+
+        if not user_id:
+            ip_address = sanitize_ip_address(ip_address)
+            if not ip_address:
+                raise ValueError("IP address is required for anonymous users")
+
+        cache_key = _limits_cache_key(user_id, ip_address)
+        cached = _get_cached_limits(cache_key)
+        if cached is not None:
+            logger.debug(f"Using cached limits for {cache_key}")
+            return cached
+
+        result = _query_user_limits(user_id, ip_address)
+        _store_cached_limits(cache_key, result)
+        return result
     except Exception as e:
-        logger.error(f"Error checking user limits: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error checking user limits: {e}")
         # Default to allowing requests on error for premium users, restrict for free
         default_tier = get_user_subscription_tier(user_id, None) if user_id else 'free'
-        return {
-            'can_generate': default_tier == 'premium',
-            'can_download': default_tier == 'premium',
-            'generations_left': 999999 if default_tier == 'premium' else 0,
-            'downloads_left': 999999 if default_tier == 'premium' else 0,
-            'reset_time': datetime(2025, 2, 1).isoformat(),
-            'current_usage': {
-                'generations_used': 0,
-                'downloads_used': 0
-            },
-            'user_tier': default_tier,
-            'is_premium': default_tier == 'premium'
-        }
+        if default_tier == 'premium':
+            return _PREMIUM_RESULT._replace(reset_time=_cached_reset_iso())
+        return _DENIED_RESULT._replace(reset_time=_cached_reset_iso(), user_tier=default_tier)
+
+def _limits_cache_key(user_id, ip_address):
+    """Cache key for a tracked identity - registered users ignore the IP."""
+    return ('user', user_id) if user_id else ('ip', ip_address)
+
+def _get_cached_limits(key):
+    """Return a fresh cached UsageResult, or None."""
+    with _limits_cache_lock:
+        entry = _limits_cache.get(key)
+        if entry is None:
+            return None
+        cached_at, result = entry
+        if time.monotonic() - cached_at >= LIMITS_CACHE_TTL:
+            del _limits_cache[key]
+            return None
+        _limits_cache.move_to_end(key)
+        return result
+
+def _store_cached_limits(key, result):
+    """Cache a limits result, evicting the least recently used entries past the cap."""
+    with _limits_cache_lock:
+        _limits_cache[key] = (time.monotonic(), result)
+        _limits_cache.move_to_end(key)
+        while len(_limits_cache) > LIMITS_CACHE_MAX_SIZE:
+            _limits_cache.popitem(last=False)
+
+def invalidate_cached_limits(user_id=None, ip_address=None):
+    """Drop the cached limits for a user or (sanitized) anonymous IP."""
+    with _limits_cache_lock:
+        _limits_cache.pop(_limits_cache_key(user_id, ip_address), None)
+
+def _query_user_limits(user_id, ip_address):
+    """Read monthly usage for a user (by user_id) or anonymous IP from the database."""
+    current_ym = _current_month_index()
+    with get_db_cursor() as cursor:
+        if user_id:
+            # REGISTERED USER: Check by user_id only
+            logger.debug(f"Checking limits for registered user {user_id}")
+            execute_prepared(cursor, 'usage_by_user', _USAGE_BY_USER_SQL, (user_id, *_FREE_LIMIT_PARAMS, current_ym))
+        else:
+            # ANONYMOUS USER: Check by IP only
+            logger.debug(f"Checking limits for anonymous IP {ip_address}")
+            execute_prepared(cursor, 'usage_by_ip', _USAGE_BY_IP_SQL, (ip_address, *_FREE_LIMIT_PARAMS, current_ym))
+
+        usage = cursor.fetchone()
+    # The connection is back in the pool; the rest is pure Python
+
+    # Registered users get their tier from the same row; a user with no
+    # usage yet still has a row, flagged by has_usage
+    if user_id and usage:
+        user_tier = resolve_subscription_tier(usage['subscription_tier'], usage['subscription_status'])
+        _store_subscription_tier(_subscription_tier_cache_key(user_id, None), user_tier)
+        if not usage['has_usage']:
+            usage = None
+    else:
+        user_tier = 'free'
+    logger.info(f"Checking limits for {user_tier} tier")
+
+    if user_tier == 'premium':
+        if not usage:
+            return _PREMIUM_RESULT._replace(reset_time=_cached_reset_iso())
+        return _PREMIUM_RESULT._replace(
+            reset_time=_cached_reset_iso(),
+            generations_used=usage['current_generations_used'],
+            downloads_used=usage['current_downloads_used']
+        )
+
+    if not usage:
+        # No usage record found
+        logger.info("No usage record found - within limits")
+        return _NO_USAGE_RESULT._replace(reset_time=_cached_reset_iso(), user_tier=user_tier)
+
+    # Remaining quota and the can_* flags are computed by the query
+    logger.info(f"Current usage: {usage['current_generations_used']} generations, {usage['current_downloads_used']} downloads")
+
+    return UsageResult(
+        usage['can_generate'], usage['can_download'],
+        usage['generations_left'], usage['downloads_left'],
+        _cached_reset_iso(),
+        usage['current_generations_used'], usage['current_downloads_used'],
+        user_tier
+    )
 
 def check_and_reset_hourly_limits(user_id, ip_address):
-    """IMPROVED: Check hourly limits with proper user vs IP separation."""
+    """
+    IMPROVED: Check hourly limits with proper user vs IP separation.
+    Reads the Redis counter when available; otherwise the rollover check and
+    the read happen in a single UPDATE ... RETURNING in Postgres.
+    """
+    if not user_id:
+        ip_address = sanitize_ip_address(ip_address)
+
+    hourly_used = get_hourly_count(user_id, ip_address)
+    if hourly_used is not None:
+        return hourly_used
+
     try:
         with get_db_cursor(commit=True) as cursor:
-            now = datetime.now()
-            
             if user_id:
                 # Registered user: check by user_id only
-                cursor.execute("""
-                    SELECT hourly_generations, last_hourly_reset 
-                    FROM user_usage_limits 
-                    WHERE user_id = %s
-                """, (user_id,))
                 logger.debug(f"Checking hourly limits for registered user {user_id}")
+                execute_prepared(cursor, 'hourly_check_user_id', _HOURLY_CHECK_SQL['user_id'], (user_id,))
             else:
                 # Anonymous user: check by IP only
-                ip_address = sanitize_ip_address(ip_address)
-                cursor.execute("""
-                    SELECT hourly_generations, last_hourly_reset 
-                    FROM user_usage_limits 
-                    WHERE user_id IS NULL AND ip_address = %s
-                """, (ip_address,))
                 logger.debug(f"Checking hourly limits for anonymous IP {ip_address}")
-            
+                execute_prepared(cursor, 'hourly_check_ip_address', _HOURLY_CHECK_SQL['ip_address'], (ip_address,))
+
             result = cursor.fetchone()
-            
+
             if not result:
                 logger.debug("No hourly usage record found")
                 return 0
-            
-            hourly_generations = result.get('hourly_generations', 0)
-            last_hourly_reset = result.get('last_hourly_reset')
-            
-            if last_hourly_reset:
-                if hasattr(last_hourly_reset, 'tzinfo') and last_hourly_reset.tzinfo:
-                    last_hourly_reset = last_hourly_reset.replace(tzinfo=None)
-                
-                if now - last_hourly_reset >= timedelta(hours=1):
-                    # Reset hourly limits
-                    if user_id:
-                        cursor.execute("""
-                            UPDATE user_usage_limits 
-                            SET hourly_generations = 0, last_hourly_reset = %s
-                            WHERE user_id = %s
-                        """, (now, user_id))
-                    else:
-                        cursor.execute("""
-                            UPDATE user_usage_limits 
-                            SET hourly_generations = 0, last_hourly_reset = %s
-                            WHERE user_id IS NULL AND ip_address = %s
-                        """, (now, ip_address))
-                    
-                    logger.info(f"Reset hourly limits for {'user ' + str(user_id) if user_id else 'IP ' + str(ip_address)}")
-                    return 0
-            
-            return hourly_generations or 0
+
+            return result.get('hourly_generations') or 0
             
     except Exception as e:
         logger.error(f"Error checking hourly limits: {e}")
         return 0
       
-def increment_hourly_usage(user_id, ip_address):
-    """IMPROVED: Increment hourly usage with proper user vs IP separation."""
+def get_hourly_count(user_id, ip_address):
+    """
+    Read the Redis hourly generation counter bumped by increment_usage, or
+    None if Redis is not in use (callers fall back to the Postgres columns).
+    ip_address must already be sanitized for anonymous users.
+    """
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None
+
     try:
-        with get_db_cursor(commit=True) as cursor:
-            now = datetime.now()
-            
-            if user_id:
-                # Registered user: update by user_id only
-                cursor.execute("""
-                    UPDATE user_usage_limits 
-                    SET hourly_generations = COALESCE(hourly_generations, 0) + 1,
-                        last_hourly_reset = COALESCE(last_hourly_reset, %s)
-                    WHERE user_id = %s
-                """, (now, user_id))
-                logger.debug(f"Incremented hourly usage for registered user {user_id}")
-            else:
-                # Anonymous user: update by IP only
-                ip_address = sanitize_ip_address(ip_address)
-                cursor.execute("""
-                    UPDATE user_usage_limits 
-                    SET hourly_generations = COALESCE(hourly_generations, 0) + 1,
-                        last_hourly_reset = COALESCE(last_hourly_reset, %s)
-                    WHERE user_id IS NULL AND ip_address = %s
-                """, (now, ip_address))
-                logger.debug(f"Incremented hourly usage for anonymous IP {ip_address}")
-                
+        # Expired keys vanish on their own, so a GET is the whole check
+        return int(redis_client.get(_hourly_counter_key(user_id, ip_address)) or 0)
+    except Exception as e:
+        logger.warning(f"Redis hourly check failed, falling back to Postgres: {e}")
+        mark_redis_unavailable()
+        return None
+
+def bump_and_get_hourly(user_id, ip_address):
+    """
+    Bump the Redis hourly generation counter and return the new count, if
+    Redis is in use. Otherwise returns None - the Postgres hourly columns are
+    reset-and-incremented by the increment_usage upsert in the same statement.
+    """
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None
+
+    try:
+        # Start the window on first use (SET NX EX), then INCR - one round-trip
+        key = _hourly_counter_key(user_id, ip_address)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(key, 0, ex=HOURLY_WINDOW_SECONDS, nx=True)
+        pipe.incr(key)
+        hourly_used = pipe.execute()[-1]
+        logger.debug(f"Incremented hourly usage in Redis for {key}")
+        return hourly_used
     except Exception as e:
-        logger.error(f"Error incrementing hourly usage: {e}")
\ No newline at end of file
+        logger.warning(f"Redis hourly increment failed, relying on Postgres: {e}")
+        mark_redis_unavailable()
+        return None
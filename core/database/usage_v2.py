@@ -1,20 +1,16 @@
 # core/database/usage_v2.py - ROBUST TRACKING SYSTEM with clean separation
-import os
 import logging
-import traceback
-from datetime import datetime, timedelta
-from .database import get_db_cursor, get_db_connection        
-from config.settings import logger
+from .database import get_db_cursor
+from .usage import _cached_reset_iso, _current_month_index, get_hourly_count, sanitize_ip_address, FREE_TIER_LIMITS
+from .usage import increment_usage as _increment_usage
+from .usage import get_user_subscription_tier as _get_subscription_tier
 
 logger = logging.getLogger(__name__)
 
-# CLEAR TIER DEFINITIONS
+# CLEAR TIER DEFINITIONS - the free tier shares usage.FREE_TIER_LIMITS, so the
+# FREE_MONTHLY_*_LIMIT settings (and reload_limits()) apply to enforcement too
 TIER_LIMITS = {
-    'free': {
-        'monthly_generations': 10,
-        'monthly_downloads': 10,
-        'hourly_generations': 5
-    },
+    'free': FREE_TIER_LIMITS,
     'premium': {
         'monthly_generations': -1,  # Unlimited
         'monthly_downloads': -1,    # Unlimited
@@ -30,34 +26,13 @@ class UsageTracker:
     """
     
     @staticmethod
-    def get_user_tier(user_id=None, user_email=None):
-        """Get user's subscription tier - only for authenticated users."""
-        if not user_id and not user_email:
-            return 'free'  # Anonymous users are always free
-        
-        try:
-            with get_db_cursor() as cursor:
-                if user_id:
-                    cursor.execute("""
-                        SELECT subscription_tier, subscription_status 
-                        FROM users 
-                        WHERE id = %s
-                    """, (user_id,))
-                else:
-                    cursor.execute("""
-                        SELECT subscription_tier, subscription_status 
-                        FROM users 
-                        WHERE email = %s
-                    """, (user_email,))
-                
-                result = cursor.fetchone()
-                if result and result.get('subscription_tier') == 'premium' and result.get('subscription_status') == 'active':
-                    return 'premium'
-                
-                return 'free'
-        except Exception as e:
-            logger.error(f"Error getting user tier: {e}")
-            return 'free'
+    def get_user_tier(user_id=None, user_email=None, cached_tier=None):
+        """Get user's subscription tier - only for authenticated users.
+
+        Goes through usage.get_user_subscription_tier so the in-process and
+        shared Redis tier caches (and their invalidations) apply here too.
+        """
+        return _get_subscription_tier(user_id, user_email, cached_tier)
     
     @staticmethod
     def sanitize_ip(ip_address):
@@ -74,33 +49,20 @@ class UsageTracker:
         if ',' in ip_address:
             ip_address = ip_address.split(',')[0].strip()
         
-        # Remove port if present
-        if ':' in ip_address and not '::' in ip_address:  # IPv4 with port
-            ip_address = ip_address.split(':')[0]
-        
-        return ip_address
+        # Port stripping and validation (ip_address is stored as INET)
+        return sanitize_ip_address(ip_address)
     
     @staticmethod
     def get_authenticated_user_usage(user_id):
         """Get usage for authenticated user by user_id only."""
+        # Month of last_reset is materialized as reset_ym (see usage.py)
+        current_ym = _current_month_index()
         try:
             with get_db_cursor() as cursor:
                 cursor.execute("""
                     SELECT 
-                        CASE 
-                            WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              OR last_reset IS NULL
-                              THEN 0 
-                            ELSE COALESCE(generations_used, 0) 
-                        END AS monthly_generations,
-                        CASE 
-                            WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              OR last_reset IS NULL
-                              THEN 0 
-                            ELSE COALESCE(downloads_used, 0) 
-                        END AS monthly_downloads,
+                        CASE WHEN reset_ym = %s THEN COALESCE(generations_used, 0) ELSE 0 END AS monthly_generations,
+                        CASE WHEN reset_ym = %s THEN COALESCE(downloads_used, 0) ELSE 0 END AS monthly_downloads,
                         CASE 
                             WHEN last_hourly_reset IS NULL 
                               OR CURRENT_TIMESTAMP - last_hourly_reset >= INTERVAL '1 hour'
@@ -111,7 +73,7 @@ class UsageTracker:
                         last_hourly_reset
                     FROM user_usage_limits
                     WHERE user_id = %s AND user_id IS NOT NULL
-                """, (user_id,))
+                """, (current_ym, current_ym, user_id))
                 
                 result = cursor.fetchone()
                 if result:
@@ -148,24 +110,14 @@ class UsageTracker:
         if not ip_address:
             raise ValueError("Valid IP address required for anonymous users")
         
+        # Month of last_reset is materialized as reset_ym (see usage.py)
+        current_ym = _current_month_index()
         try:
             with get_db_cursor() as cursor:
                 cursor.execute("""
                     SELECT 
-                        CASE 
-                            WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              OR last_reset IS NULL
-                              THEN 0 
-                            ELSE COALESCE(generations_used, 0) 
-                        END AS monthly_generations,
-                        CASE 
-                            WHEN EXTRACT(MONTH FROM last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                              OR EXTRACT(YEAR FROM last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                              OR last_reset IS NULL
-                              THEN 0 
-                            ELSE COALESCE(downloads_used, 0) 
-                        END AS monthly_downloads,
+                        CASE WHEN reset_ym = %s THEN COALESCE(generations_used, 0) ELSE 0 END AS monthly_generations,
+                        CASE WHEN reset_ym = %s THEN COALESCE(downloads_used, 0) ELSE 0 END AS monthly_downloads,
                         CASE 
                             WHEN last_hourly_reset IS NULL 
                               OR CURRENT_TIMESTAMP - last_hourly_reset >= INTERVAL '1 hour'
@@ -176,7 +128,7 @@ class UsageTracker:
                         last_hourly_reset
                     FROM user_usage_limits
                     WHERE ip_address = %s AND user_id IS NULL
-                """, (ip_address,))
+                """, (current_ym, current_ym, ip_address))
                 
                 result = cursor.fetchone()
                 if result:
@@ -207,15 +159,16 @@ class UsageTracker:
             }
     
     @staticmethod
-    def check_limits(user_id=None, ip_address=None, user_email=None):
+    def check_limits(user_id=None, ip_address=None, user_email=None, cached_tier=None):
         """
         Check usage limits with clean separation:
         - If user_id provided: check authenticated user limits
         - If no user_id but ip_address: check anonymous user limits
+        cached_tier is a tier from an unexpired session claim (skips the users lookup).
         """
         if user_id:
             # AUTHENTICATED USER PATH
-            tier = UsageTracker.get_user_tier(user_id, user_email)
+            tier = UsageTracker.get_user_tier(user_id, user_email, cached_tier)
             usage = UsageTracker.get_authenticated_user_usage(user_id)
             logger.info(f"Checking limits for authenticated user {user_id} (tier: {tier})")
         else:
@@ -226,6 +179,12 @@ class UsageTracker:
         
         limits = TIER_LIMITS[tier]
         
+        # The Redis counter is the hourly source of truth while Redis is up;
+        # the Postgres window columns only cover for it when it is not
+        hourly_used = get_hourly_count(user_id, None if user_id else sanitize_ip_address(ip_address))
+        if hourly_used is None:
+            hourly_used = usage['hourly_generations']
+        
         # Check limits
         can_generate = True
         can_download = True
@@ -238,7 +197,7 @@ class UsageTracker:
                 can_download = usage['monthly_downloads'] < limits['monthly_downloads']
         
         # Hourly limits (apply to all tiers)
-        hourly_exceeded = usage['hourly_generations'] >= limits['hourly_generations']
+        hourly_exceeded = hourly_used >= limits['hourly_generations']
         if hourly_exceeded:
             can_generate = False
         
@@ -259,7 +218,7 @@ class UsageTracker:
             'generations_left': generations_left,
             'downloads_left': downloads_left,
             'hourly_exceeded': hourly_exceeded,
-            'hourly_used': usage['hourly_generations'],
+            'hourly_used': hourly_used,
             'hourly_limit': limits['hourly_generations'],
             'monthly_used': {
                 'generations': usage['monthly_generations'],
@@ -271,7 +230,7 @@ class UsageTracker:
             },
             'tier': tier,
             'tracking_method': 'user_id' if user_id else 'ip_address',
-            'reset_time': datetime(2025, 2, 1).isoformat()
+            'reset_time': _cached_reset_iso()
         }
     
     @staticmethod
@@ -282,113 +241,21 @@ class UsageTracker:
         - If no user_id: increment for anonymous user by IP
         """
         try:
-            with get_db_connection() as conn:
-                with conn.cursor() as cursor:
-                    now = datetime.now()
-                    
-                    if user_id:
-                        # AUTHENTICATED USER: Track by user_id only
-                        logger.info(f"Incrementing {action_type} for authenticated user {user_id}")
-                        
-                        cursor.execute("""
-                            INSERT INTO user_usage_limits 
-                              (user_id, ip_address, generations_used, downloads_used, hourly_generations, last_reset, last_hourly_reset)
-                            VALUES 
-                              (%s, '0.0.0.0', 
-                               CASE WHEN %s = 'generation' THEN 1 ELSE 0 END, 
-                               CASE WHEN %s = 'download' THEN 1 ELSE 0 END,
-                               CASE WHEN %s = 'generation' THEN 1 ELSE 0 END,
-                               %s, %s)
-                            ON CONFLICT (user_id) WHERE user_id IS NOT NULL DO UPDATE 
-                            SET 
-                              generations_used = CASE 
-                                WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                                  OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                                  THEN CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                                ELSE user_usage_limits.generations_used + CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                              END,
-                              downloads_used = CASE 
-                                WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                                  OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                                  THEN CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                                ELSE user_usage_limits.downloads_used + CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                              END,
-                              hourly_generations = CASE 
-                                WHEN user_usage_limits.last_hourly_reset IS NULL 
-                                  OR CURRENT_TIMESTAMP - user_usage_limits.last_hourly_reset >= INTERVAL '1 hour'
-                                  THEN CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                                ELSE user_usage_limits.hourly_generations + CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                              END,
-                              last_reset = %s,
-                              last_hourly_reset = CASE 
-                                WHEN user_usage_limits.last_hourly_reset IS NULL 
-                                  OR CURRENT_TIMESTAMP - user_usage_limits.last_hourly_reset >= INTERVAL '1 hour'
-                                  THEN %s
-                                ELSE user_usage_limits.last_hourly_reset
-                              END,
-                              ip_address = '0.0.0.0'
-                        """, (
-                            user_id, action_type, action_type, action_type, now, now,
-                            action_type, action_type, action_type, action_type, 
-                            action_type, action_type, now, now
-                        ))
-                    
-                    else:
-                        # ANONYMOUS USER: Track by IP only
-                        ip_address = UsageTracker.sanitize_ip(ip_address)
-                        if not ip_address:
-                            raise ValueError("Valid IP address required for anonymous users")
-                        
-                        logger.info(f"Incrementing {action_type} for anonymous IP {ip_address}")
-                        
-                        cursor.execute("""
-                            INSERT INTO user_usage_limits 
-                              (user_id, ip_address, generations_used, downloads_used, hourly_generations, last_reset, last_hourly_reset)
-                            VALUES 
-                              (NULL, %s, 
-                               CASE WHEN %s = 'generation' THEN 1 ELSE 0 END, 
-                               CASE WHEN %s = 'download' THEN 1 ELSE 0 END,
-                               CASE WHEN %s = 'generation' THEN 1 ELSE 0 END,
-                               %s, %s)
-                            ON CONFLICT (ip_address) WHERE user_id IS NULL DO UPDATE 
-                            SET 
-                              generations_used = CASE 
-                                WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                                  OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                                  THEN CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                                ELSE user_usage_limits.generations_used + CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                              END,
-                              downloads_used = CASE 
-                                WHEN EXTRACT(MONTH FROM user_usage_limits.last_reset) != EXTRACT(MONTH FROM CURRENT_TIMESTAMP)
-                                  OR EXTRACT(YEAR FROM user_usage_limits.last_reset) != EXTRACT(YEAR FROM CURRENT_TIMESTAMP)
-                                  THEN CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                                ELSE user_usage_limits.downloads_used + CASE WHEN %s = 'download' THEN 1 ELSE 0 END
-                              END,
-                              hourly_generations = CASE 
-                                WHEN user_usage_limits.last_hourly_reset IS NULL 
-                                  OR CURRENT_TIMESTAMP - user_usage_limits.last_hourly_reset >= INTERVAL '1 hour'
-                                  THEN CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                                ELSE user_usage_limits.hourly_generations + CASE WHEN %s = 'generation' THEN 1 ELSE 0 END
-                              END,
-                              last_reset = %s,
-                              last_hourly_reset = CASE 
-                                WHEN user_usage_limits.last_hourly_reset IS NULL 
-                                  OR CURRENT_TIMESTAMP - user_usage_limits.last_hourly_reset >= INTERVAL '1 hour'
-                                  THEN %s
-                                ELSE user_usage_limits.last_hourly_reset
-                              END
-                        """, (
-                            ip_address, action_type, action_type, action_type, now, now,
-                            action_type, action_type, action_type, action_type, 
-                            action_type, action_type, now, now
-                        ))
-                
-                conn.commit()
-                logger.info(f"Successfully incremented {action_type} usage")
+            if user_id:
+                # AUTHENTICATED USER: Track by user_id only
+                logger.info(f"Incrementing {action_type} for authenticated user {user_id}")
+            else:
+                # ANONYMOUS USER: Track by IP only
+                ip_address = UsageTracker.sanitize_ip(ip_address)
+                if not ip_address:
+                    raise ValueError("Valid IP address required for anonymous users")
+
+                logger.info(f"Incrementing {action_type} for anonymous IP {ip_address}")
+
+            return _increment_usage(ip_address=ip_address, user_id=user_id, action_type=action_type)
                 
         except Exception as e:
-            logger.error(f"Error incrementing usage: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error incrementing usage: {e}")
             raise
 
 # Backwards compatibility functions
@@ -0,0 +1,98 @@
+# core/services/redis_client.py
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Short timeouts - Redis sits on hot request paths and callers fall back to
+# Postgres when it is slow or unreachable
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '0.5'))
+REDIS_RETRY_INTERVAL = 30  # seconds to wait before retrying an unreachable Redis
+
+_redis_client = None
+_redis_pid = None
+_redis_failed_at = None
+_redis_lock = threading.Lock()
+
+def get_redis_url(default='redis://localhost:6379/0'):
+    """Get the Redis URL, converting Azure connection strings to redis:// form."""
+    redis_url = os.getenv('REDIS_URL', default)
+    if not redis_url:
+        return None
+
+    # If Azure Redis URL format, convert it to proper redis:// format
+    if 'redis.cache.windows.net' in redis_url:
+        # Parse Azure Redis connection string: host:port,password=xxx,ssl=True,abortConnect=False
+        parts = redis_url.split(',')
+        host_port = parts[0]
+        password = None
+        ssl_required = False
+        
+        for part in parts[1:]:
+            if part.startswith('password='):
+                password = part.split('=', 1)[1]
+            elif part.startswith('ssl=True'):
+                ssl_required = True
+        
+        if ssl_required and password:
+            # Use rediss:// for SSL connections with proper SSL parameters
+            # For production, use CERT_REQUIRED for security
+            ssl_cert_reqs = os.getenv('REDIS_SSL_CERT_REQS', 'CERT_NONE')
+            redis_url = f"rediss://default:{password}@{host_port}/0?ssl_cert_reqs={ssl_cert_reqs}"
+        elif password:
+            redis_url = f"redis://default:{password}@{host_port}/0"
+        else:
+            redis_url = f"redis://{host_port}/0"
+        
+        logger.info(f"Converted Azure Redis URL to: {redis_url.replace(password, '***') if password else redis_url}")
+
+    return redis_url
+
+def get_redis_client():
+    """
+    Get a shared Redis client for application data (counters, caches).
+    Returns None when REDIS_URL is not configured or Redis is unreachable,
+    so callers can fall back to Postgres.
+    """
+    global _redis_client, _redis_pid, _redis_failed_at
+
+    if not os.getenv('REDIS_URL'):
+        return None
+
+    pid = os.getpid()
+    if _redis_client is not None and _redis_pid == pid:
+        return _redis_client
+
+    if _redis_failed_at is not None and time.monotonic() - _redis_failed_at < REDIS_RETRY_INTERVAL:
+        return None
+
+    with _redis_lock:
+        if _redis_client is not None and _redis_pid == pid:
+            return _redis_client
+        try:
+            import redis
+            client = redis.Redis.from_url(
+                get_redis_url(),
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                decode_responses=True
+            )
+            client.ping()
+            _redis_client = client
+            _redis_pid = pid
+            _redis_failed_at = None
+            logger.info("Redis client initialized")
+        except Exception as e:
+            logger.warning(f"Redis unavailable, falling back to Postgres: {e}")
+            _redis_client = None
+            _redis_failed_at = time.monotonic()
+    return _redis_client
+
+def mark_redis_unavailable():
+    """Drop the shared client after a failed command so the next call reconnects."""
+    global _redis_client, _redis_failed_at
+    with _redis_lock:
+        _redis_client = None
+        _redis_failed_at = time.monotonic()
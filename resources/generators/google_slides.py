@@ -1,4 +1,6 @@
 import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Dict, Tuple, Any
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
@@ -6,17 +8,44 @@ from googleapiclient.errors import HttpError
 
 logger = logging.getLogger(__name__)
 
+# The Drive permission update only needs the presentation to exist, so it runs
+# alongside the slide batchUpdate instead of after it
+_permissions_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='slides-permissions')
+
+BULLET = "\n• "
+TEACHER_NOTES_PREFIX = "Teacher Notes:" + BULLET
+
+# Request fragments that never change - built once and shared by every request
+# (the client only serializes them)
+TEXT_BOX_SIZE = {
+    'width': {'magnitude': 4000000, 'unit': 'EMU'},
+    'height': {'magnitude': 1000000, 'unit': 'EMU'}
+}
+LEFT_COLUMN_TRANSFORM = {
+    'scaleX': 1, 'scaleY': 1,
+    'translateX': 1000000, 'translateY': 1500000,
+    'unit': 'EMU'
+}
+RIGHT_COLUMN_TRANSFORM = {
+    'scaleX': 1, 'scaleY': 1,
+    'translateX': 5000000, 'translateY': 1500000,
+    'unit': 'EMU'
+}
+LAYOUT_REFERENCES = {
+    layout: {'predefinedLayout': layout} for layout in ('TITLE_AND_BODY', 'TWO_COLUMNS')
+}
+
 def format_content_list(content: List[str]) -> str:
     """Format a list of content items into a properly formatted string."""
     if not content:
         return ""
-    return "\n• " + "\n• ".join(str(item).strip() for item in content if item)
+    return BULLET + BULLET.join(str(item).strip() for item in filter(None, content))
 
 def format_teacher_notes(notes: List[str]) -> str:
     """Format teacher notes into a properly formatted string."""
     if not notes:
         return ""
-    return "Teacher Notes:\n• " + "\n• ".join(str(note).strip() for note in notes if note)
+    return TEACHER_NOTES_PREFIX + BULLET.join(str(note).strip() for note in filter(None, notes))
 
 def get_layout_for_content(slide_content: Dict[str, Any]) -> str:
     """Determine the appropriate slide layout based on content structure."""
@@ -26,18 +55,16 @@ def get_layout_for_content(slide_content: Dict[str, Any]) -> str:
         return 'TWO_COLUMNS'
     return 'TITLE_AND_BODY'
 
-def create_text_box_request(slide_id: str, text: str, transform: Dict[str, Any]) -> Dict[str, Any]:
-    """Create a request to add a text box to a slide."""
+def create_text_box_request(slide_id: str, text: str, transform: Dict[str, Any],
+                            counter: int) -> Dict[str, Any]:
+    """Create a request to add a text box to a slide (counter keeps object IDs unique)."""
     return {
         'createShape': {
-            'objectId': f"{slide_id}_textbox_{hash(text) % 10000}",
+            'objectId': f"{slide_id}_tb_{counter}",
             'shapeType': 'TEXT_BOX',
             'elementProperties': {
                 'pageObjectId': slide_id,
-                'size': {
-                    'width': {'magnitude': 4000000, 'unit': 'EMU'},
-                    'height': {'magnitude': 1000000, 'unit': 'EMU'}
-                },
+                'size': TEXT_BOX_SIZE,
                 'transform': transform
             }
         }
@@ -86,35 +113,23 @@ def create_google_slides_presentation(credentials: Credentials,
         presentation_id = presentation.get('presentationId')
         logger.info(f"Created presentation: {presentation_id}")
         
-        # Step 2: Create slides with appropriate layouts
-        requests = []
-        for slide in structured_content:
-            layout = get_layout_for_content(slide)
-            requests.append({
+        # Step 2: Build every request up front. Slide object IDs are assigned
+        # here rather than read back from the API, so slide creation and
+        # population go out in a single batchUpdate (no per-slide round-trips
+        # and no refetch of the presentation in between).
+        create_requests = []
+        populate_requests = []
+        box_counter = itertools.count()
+        for idx, slide_content in enumerate(structured_content):
+            slide_id = f"slide_{idx}"
+            layout = get_layout_for_content(slide_content)
+            create_requests.append({
                 'createSlide': {
-                    'slideLayoutReference': {
-                        'predefinedLayout': layout
-                    },
+                    'objectId': slide_id,
+                    'slideLayoutReference': LAYOUT_REFERENCES[layout],
                     'placeholderIdMappings': []
                 }
             })
-        
-        # Execute slide creation
-        slides_service.presentations().batchUpdate(
-            presentationId=presentation_id,
-            body={'requests': requests}
-        ).execute()
-        
-        # Get updated presentation
-        presentation = slides_service.presentations().get(
-            presentationId=presentation_id
-        ).execute()
-        slides = presentation.get('slides', [])
-        
-        # Step 3: Populate slides
-        for idx, (slide_object, slide_content) in enumerate(zip(slides[1:], structured_content)):
-            slide_id = slide_object.get('objectId')
-            populate_requests = []
             
             # Add title
             title = slide_content.get('title', 'Untitled Slide')
@@ -127,26 +142,16 @@ def create_google_slides_presentation(credentials: Credentials,
             })
             
             # Handle different layout types
-            if get_layout_for_content(slide_content) == 'TWO_COLUMNS':
+            if layout == 'TWO_COLUMNS':
                 # Left column
                 left_content = format_content_list(slide_content.get('left_column', []))
                 if left_content:
-                    left_transform = {
-                        'scaleX': 1, 'scaleY': 1,
-                        'translateX': 1000000, 'translateY': 1500000,
-                        'unit': 'EMU'
-                    }
-                    populate_requests.append(create_text_box_request(slide_id, left_content, left_transform))
+                    populate_requests.append(create_text_box_request(slide_id, left_content, LEFT_COLUMN_TRANSFORM, next(box_counter)))
                 
                 # Right column
                 right_content = format_content_list(slide_content.get('right_column', []))
                 if right_content:
-                    right_transform = {
-                        'scaleX': 1, 'scaleY': 1,
-                        'translateX': 5000000, 'translateY': 1500000,
-                        'unit': 'EMU'
-                    }
-                    populate_requests.append(create_text_box_request(slide_id, right_content, right_transform))
+                    populate_requests.append(create_text_box_request(slide_id, right_content, RIGHT_COLUMN_TRANSFORM, next(box_counter)))
             else:
                 # Regular content
                 content = format_content_list(slide_content.get('content', []))
@@ -183,7 +188,7 @@ def create_google_slides_presentation(credentials: Credentials,
             # Add visual elements placeholder text
             visual_elements = slide_content.get('visual_elements', [])
             if visual_elements:
-                notes = "\n\nSuggested Visual Elements:\n• " + "\n• ".join(visual_elements)
+                notes = "\n\nSuggested Visual Elements:" + BULLET + BULLET.join(visual_elements)
                 if teacher_notes:
                     populate_requests.append({
                         'insertText': {
@@ -193,15 +198,26 @@ def create_google_slides_presentation(credentials: Credentials,
                         }
                     })
             
-            # Execute updates for this slide
-            if populate_requests:
-                slides_service.presentations().batchUpdate(
-                    presentationId=presentation_id,
-                    body={'requests': populate_requests}
-                ).execute()
+        # Set proper permissions for the presentation (in parallel with Step 3;
+        # errors are logged inside set_presentation_permissions)
+        permissions_future = _permissions_executor.submit(
+            set_presentation_permissions, credentials, presentation_id
+        )
+        
+        # Step 3: Create and populate all slides in one call
+        try:
+            slides_service.presentations().batchUpdate(
+                presentationId=presentation_id,
+                body={'requests': create_requests + populate_requests}
+            ).execute()
+        except Exception:
+            # Half-built deck: skip the grant if it has not started, otherwise
+            # let it finish before the original error propagates
+            if not permissions_future.cancel():
+                wait([permissions_future])
+            raise
         
-        # Set proper permissions for the presentation
-        set_presentation_permissions(credentials, presentation_id)
+        permissions_future.result()
         
         presentation_url = f"https://docs.google.com/presentation/d/{presentation_id}"
         logger.info(f"Generated presentation: {presentation_url}")
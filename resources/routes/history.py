@@ -1,19 +1,158 @@
 # Fixed history_routes.py with proper duplicate prevention
-from functools import wraps
-from flask import Blueprint, request, jsonify, session
+from functools import lru_cache, wraps
+from flask import Blueprint, Response, request, jsonify, session
 from config.settings import logger
-from core.database.database import get_db_cursor, get_db_connection, get_user_by_email
+from core.database.database import get_db_cursor, get_db_connection, get_user_by_email, execute_prepared
+from core.services.redis_client import get_redis_client, mark_redis_unavailable
 from psycopg2.extras import RealDictCursor
 import traceback
+import os
+import re
 import json
 import hashlib
+import queue
+import atexit
+import time
+import secrets
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+# Optional orjson import - faster history serialization when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 history_blueprint = Blueprint("history_blueprint", __name__)
 
 # Cache for request deduplication (in-memory - consider Redis for production)
 recent_requests = {}
-anonymous_history_cache = {}
+
+# Signed-in user ids by email, for sessions that predate session['user_id']
+USER_ID_CACHE_TTL = 60  # seconds
+USER_ID_CACHE_MAX_SIZE = 4096
+_user_id_cache = OrderedDict()
+_user_id_cache_lock = threading.Lock()
+
+# Optional user_activities columns, probed once per process (schema is fixed at runtime)
+_OPTIONAL_ACTIVITY_COLUMNS = ('activity_time', 'created_at', 'content_hash', 'activity_date')
+_activity_columns = None
+_activity_columns_lock = threading.Lock()
+
+# History SQL, formatted once for each timestamp column the schema may use
+_TIMESTAMP_COLUMNS = ('activity_time', 'created_at')
+
+_HISTORY_LIST_SQL_TEMPLATE = """
+    WITH ranked_activities AS (
+        SELECT a.id, a.activity, a.lesson_data, a.{ts} as timestamp,
+               a.content_hash,
+               ROW_NUMBER() OVER (
+                   PARTITION BY COALESCE(a.content_hash, a.id::text)
+                   ORDER BY a.{ts} DESC
+               ) as rn
+        FROM user_activities a
+        WHERE a.user_id = $1
+        AND a.lesson_data IS NOT NULL
+    )
+    SELECT id, timestamp,
+           COALESCE(NULLIF(btrim(substring(activity from '^Created (.*)$')), ''),
+                    NULLIF(lesson_data->>'resourceType', ''),
+                    'Presentation') as resource_type,
+           COALESCE(NULLIF(lesson_data->>'generatedTitle', ''),
+                    NULLIF(lesson_data->>'lessonTopic', ''),
+                    NULLIF(lesson_data->>'subjectFocus', ''),
+                    'Untitled Lesson') as title{lesson_data}
+    FROM ranked_activities 
+    WHERE rn = 1
+    ORDER BY timestamp DESC
+    LIMIT 20
+"""
+
+# Keyed by (timestamp column, summary); summary listings leave out lesson_data
+_HISTORY_LIST_SQL = {
+    (ts, summary): _HISTORY_LIST_SQL_TEMPLATE.format(ts=ts, lesson_data='' if summary else ', lesson_data')
+    for ts in _TIMESTAMP_COLUMNS for summary in (False, True)
+}
+
+_HISTORY_ETAG_SQL = {
+    ts: f"""
+        SELECT MAX({ts})::text as latest, COUNT(*) as total
+        FROM user_activities WHERE user_id = $1
+    """
+    for ts in _TIMESTAMP_COLUMNS
+}
+
+_HISTORY_UPSERT_SQL = {
+    ts: f"""
+        INSERT INTO user_activities (user_id, activity, lesson_data, content_hash, activity_date, {ts})
+        VALUES ($1, $2, $3, $4, CURRENT_DATE, CURRENT_TIMESTAMP)
+        ON CONFLICT ON CONSTRAINT unique_user_activity_daily
+        DO UPDATE SET 
+            lesson_data = EXCLUDED.lesson_data,
+            activity = EXCLUDED.activity,
+            {ts} = CURRENT_TIMESTAMP
+        RETURNING id, 
+            CASE WHEN xmax = 0 THEN 'inserted' ELSE 'updated' END as action
+    """
+    for ts in _TIMESTAMP_COLUMNS
+}
+
+# Schemas without content_hash: update a recent entry for the same topic/type,
+# else insert
+_HISTORY_LEGACY_SAVE_SQL = {
+    ts: f"""
+        WITH existing AS (
+            SELECT id FROM user_activities 
+            WHERE user_id = %(user_id)s 
+            AND lesson_data->>'lessonTopic' = %(title)s
+            AND lesson_data->>'resourceType' = %(resource_type)s
+            AND {ts} > CURRENT_TIMESTAMP - INTERVAL '5 minutes'
+            LIMIT 1
+        ), updated AS (
+            UPDATE user_activities 
+            SET lesson_data = %(lesson_data)s::jsonb, 
+                activity = %(activity)s,
+                {ts} = CURRENT_TIMESTAMP
+            WHERE id = (SELECT id FROM existing)
+            RETURNING id
+        ), inserted AS (
+            INSERT INTO user_activities (user_id, activity, lesson_data, {ts})
+            SELECT %(user_id)s, %(activity)s, %(lesson_data)s::jsonb, CURRENT_TIMESTAMP
+            WHERE NOT EXISTS (SELECT 1 FROM existing)
+            RETURNING id
+        )
+        SELECT id, 'updated' as action FROM updated
+        UNION ALL
+        SELECT id, 'inserted' as action FROM inserted
+    """
+    for ts in _TIMESTAMP_COLUMNS
+}
+
+# Serialized GET /user/history responses for signed-in users, shared via Redis
+HISTORY_CACHE_TTL = 60  # seconds; POST and clear invalidate sooner
+
+# Anonymous history lives in a Redis list keyed by a random id kept in the
+# session, so the signed cookie no longer carries the whole list. Without
+# Redis it falls back to session['anonymous_history'].
+ANONYMOUS_HISTORY_MAX_ITEMS = 10
+ANONYMOUS_HISTORY_TTL = 86400  # seconds
+
+# Response body for visitors who have never saved anything
+_EMPTY_ANONYMOUS_HISTORY = json.dumps({"history": [], "user_authenticated": False}, separators=(',', ':'))
+
+# Opt-in write-behind for signed-in saves: POST queues the upsert and answers
+# 202, a background thread writes it and invalidates the cached history. Off
+# by default - the 202 carries no id and a failed background write is only
+# logged, so enable it once the client handles that. When the bounded queue
+# is full, saves are written synchronously.
+HISTORY_WRITE_BEHIND = os.environ.get('HISTORY_WRITE_BEHIND', 'false').lower() == 'true'
+HISTORY_WRITE_BEHIND_MAX_PENDING = 1000
+
+_pending_history = queue.Queue(maxsize=HISTORY_WRITE_BEHIND_MAX_PENDING)
+_history_writer = None
+_history_writer_lock = threading.Lock()
 
 def require_auth(f):
     @wraps(f)
@@ -23,6 +162,318 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _jdumps(value):
+    """Serialize to a compact JSON str (psycopg2 and Redis both take text)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(',', ':'))
+
+def _jloads(data):
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+def _get_activity_columns(cursor):
+    """Return which optional user_activities columns exist, querying only on first use."""
+    global _activity_columns
+    if _activity_columns is None:
+        with _activity_columns_lock:
+            if _activity_columns is None:
+                # A plain cursor on the same connection, whatever the caller's row type
+                with cursor.connection.cursor() as probe:
+                    probe.execute("""
+                        SELECT column_name 
+                        FROM information_schema.columns 
+                        WHERE table_schema = 'public' 
+                        AND table_name = 'user_activities'
+                        AND column_name = ANY(%s);
+                    """, (list(_OPTIONAL_ACTIVITY_COLUMNS),))
+                    _activity_columns = frozenset(row[0] for row in probe)
+    return _activity_columns
+
+def _get_timestamp_col(cursor):
+    """Name of the user_activities timestamp column ('activity_time' on newer schemas)."""
+    return 'activity_time' if 'activity_time' in _get_activity_columns(cursor) else 'created_at'
+
+def _resolve_user_id(user_email):
+    """
+    Database id of the signed-in user: from the session when auth already
+    stored it, else from a short-lived email -> id cache in front of
+    get_user_by_email (ids never change for an email).
+    """
+    user_id = session.get('user_id')
+    if user_id:
+        return user_id
+    
+    with _user_id_cache_lock:
+        cached = _user_id_cache.get(user_email)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    
+    user = get_user_by_email(user_email)
+    if not user:
+        return None
+    with _user_id_cache_lock:
+        _user_id_cache[user_email] = (time.monotonic() + USER_ID_CACHE_TTL, user["id"])
+        _user_id_cache.move_to_end(user_email)
+        while len(_user_id_cache) > USER_ID_CACHE_MAX_SIZE:
+            _user_id_cache.popitem(last=False)
+    return user["id"]
+
+def _history_cache_key(user_email, summary=False):
+    return f"hist:{user_email}:summary" if summary else f"hist:{user_email}"
+
+def _history_version_key(user_email):
+    return f"hist_ver:{user_email}"
+
+def _initial_history_version():
+    """Seed for a missing change counter: a millisecond clock, so a counter that
+    was evicted never restarts at a value that earlier ETags already used."""
+    return int(time.time() * 1000)
+
+def _get_cached_history(user_email, summary=False, today=None):
+    """
+    Return (version, cached history JSON) for a user, normally in one round-trip.
+    version is the user's history change counter; both are None without
+    Redis, and the JSON is None on a miss or when it was cached for an
+    older version or rendered on a day other than today (dates are relative).
+    """
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None, None
+    try:
+        version_key = _history_version_key(user_email)
+        version, cached = redis_client.mget(version_key, _history_cache_key(user_email, summary))
+        if version is None:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(version_key, _initial_history_version(), nx=True)
+            pipe.get(version_key)
+            version, cached = pipe.execute()[-1], None
+    except Exception as e:
+        logger.warning(f"Redis history lookup failed, falling back to Postgres: {e}")
+        mark_redis_unavailable()
+        return None, None
+    if cached is not None:
+        # Entries are "<version>-<day>:<json>"; a GET that read the database
+        # before a save can store its body after the save's INCR, so check the tag
+        cached_tag, _, payload = cached.partition(':')
+        cached = payload if cached_tag == _history_tag(version, today) else None
+    return version, cached
+
+def _history_tag(version, today):
+    """Cache/ETag tag for a history version rendered on a given day."""
+    return f"{version}-{today:%Y%m%d}" if today else str(version)
+
+def _cache_history(user_email, payload, summary=False, version=None, today=None):
+    """Cache a history body for the version read before the database query."""
+    redis_client = get_redis_client()
+    if redis_client is None or version is None:
+        return
+    try:
+        redis_client.setex(_history_cache_key(user_email, summary), HISTORY_CACHE_TTL,
+                           f"{_history_tag(version, today)}:{payload}")
+    except Exception as e:
+        logger.warning(f"Redis history store failed: {e}")
+        mark_redis_unavailable()
+
+def invalidate_history_cache(user_email):
+    """Drop a user's cached history and bump its ETag version after it changes."""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return
+    try:
+        version_key = _history_version_key(user_email)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(version_key, _initial_history_version(), nx=True)
+        pipe.incr(version_key)
+        pipe.delete(_history_cache_key(user_email), _history_cache_key(user_email, True))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis history invalidation failed: {e}")
+        mark_redis_unavailable()
+
+def _summarize_history(history):
+    """History items without their lessonData blobs, for list views."""
+    return [{k: v for k, v in item.items() if k != 'lessonData'} for item in history]
+
+def _anonymous_history_store(create=False):
+    """
+    Return (redis_client, key) for this session's anonymous history, or (None, None).
+    History still held in the session (saved by older code, or while Redis was
+    down) is moved into the Redis list first so it is not shadowed by it.
+    """
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return None, None
+    history_id = session.get('anon_history_id')
+    if not history_id:
+        if not create and not session.get('anonymous_history'):
+            return redis_client, None
+        history_id = session['anon_history_id'] = secrets.token_urlsafe(16)
+    key = f"anonhist:{history_id}"
+    if session.get('anonymous_history'):
+        history = _unpack_anonymous_history(session['anonymous_history'])
+        if history:
+            try:
+                # Session items are the newer ones: push them ahead of anything in Redis
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.lpush(key, *[_jdumps(item) for item in reversed(history)])
+                pipe.ltrim(key, 0, ANONYMOUS_HISTORY_MAX_ITEMS - 1)
+                pipe.expire(key, ANONYMOUS_HISTORY_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Redis anonymous history migration failed, using session: {e}")
+                mark_redis_unavailable()
+                return None, None
+        session.pop('anonymous_history')
+        session.modified = True
+    return redis_client, key
+
+def _pack_anonymous_history(history):
+    """Session encoding: each distinct lessonData stored once, items refer to it by index."""
+    index, refs, seq = [], {}, []
+    for item in history:
+        lesson_data = item.get('lessonData', {})
+        blob_key = json.dumps(lesson_data, sort_keys=True)
+        if blob_key not in refs:
+            refs[blob_key] = len(index)
+            index.append(lesson_data)
+        entry = {k: v for k, v in item.items() if k != 'lessonData'}
+        entry['ref'] = refs[blob_key]
+        seq.append(entry)
+    return {"index": index, "seq": seq}
+
+def _unpack_anonymous_history(stored):
+    if not stored:
+        return []
+    if isinstance(stored, list):  # written before the packed encoding
+        return stored
+    index = stored.get('index', [])
+    history = []
+    for entry in stored.get('seq', []):
+        item = {k: v for k, v in entry.items() if k != 'ref'}
+        item['lessonData'] = index[entry['ref']]
+        history.append(item)
+    return history
+
+def _load_anonymous_history():
+    """Newest-first anonymous history for this session."""
+    redis_client, key = _anonymous_history_store()
+    if redis_client is None:
+        return _unpack_anonymous_history(session.get('anonymous_history'))
+    if key is None:
+        return []
+    try:
+        items = redis_client.lrange(key, 0, -1)
+    except Exception as e:
+        logger.warning(f"Redis anonymous history lookup failed: {e}")
+        mark_redis_unavailable()
+        return _unpack_anonymous_history(session.get('anonymous_history'))
+    try:
+        return [_jloads(item) for item in items]
+    except json.JSONDecodeError as e:
+        # Not a Redis outage: drop the unreadable list so the session starts clean
+        logger.warning(f"Discarding corrupt anonymous history {key}: {e}")
+        redis_client.delete(key)
+        return []
+
+def _save_anonymous_history(history, new_item=None, updated_indexes=()):
+    """Persist a new item (pushed to the front) or in-place updates to anonymous history."""
+    redis_client, key = _anonymous_history_store(create=True)
+    if redis_client is not None:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            if new_item is not None:
+                pipe.lpush(key, _jdumps(new_item))
+                pipe.ltrim(key, 0, ANONYMOUS_HISTORY_MAX_ITEMS - 1)
+            for index in updated_indexes:
+                pipe.lset(key, index, _jdumps(history[index]))
+            pipe.expire(key, ANONYMOUS_HISTORY_TTL)
+            pipe.execute()
+            return
+        except Exception as e:
+            logger.warning(f"Redis anonymous history store failed, using session: {e}")
+            mark_redis_unavailable()
+    if new_item is not None:
+        history = [new_item] + history
+    session['anonymous_history'] = _pack_anonymous_history(history[:ANONYMOUS_HISTORY_MAX_ITEMS])
+    session.modified = True
+
+def _new_anonymous_history_id():
+    """Random item id, stable for the item's lifetime (list positions shift on every save)."""
+    return f"session-{secrets.token_urlsafe(8)}"
+
+def _ensure_anonymous_history_ids(history):
+    """
+    Replace missing, positional ("session-<n>") or repeated item ids, as
+    stored by older code, with random ones and persist them.
+    """
+    seen, missing = set(), []
+    for index, item in enumerate(history):
+        item_id = item.get('id')
+        if not item_id or item_id in seen or item_id.partition('-')[2].isdigit():
+            item['id'] = _new_anonymous_history_id()
+            missing.append(index)
+        seen.add(item['id'])
+    if missing:
+        _save_anonymous_history(history, updated_indexes=missing)
+
+def _clear_anonymous_history():
+    redis_client, key = _anonymous_history_store()
+    if redis_client is not None and key is not None:
+        try:
+            redis_client.delete(key)
+        except Exception as e:
+            logger.warning(f"Redis anonymous history clear failed: {e}")
+            mark_redis_unavailable()
+    if 'anonymous_history' in session:
+        session.pop('anonymous_history')
+        session.modified = True
+
+def _history_etag(user_email, version, today):
+    """
+    Weak ETag for a user's history at a given change-counter version, as
+    rendered on a given day - "Today"/"Yesterday" labels change at midnight.
+    """
+    return f"{hashlib.sha256(user_email.encode()).hexdigest()[:16]}-{_history_tag(version, today)}"
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+def _history_response(payload, etag=None):
+    """
+    Wrap serialized history JSON with the private caching headers. Without a
+    version-based etag the tag is a digest of the payload, which still turns
+    an unchanged revalidation into a bodyless 304.
+    """
+    if not etag:
+        etag = hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+    response = Response(payload, mimetype='application/json')
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    response.set_etag(etag, weak=True)
+    return response
+
+# Title keywords that identify a resource type, checked in priority order;
+# one compiled alternation per type replaces a Python-level scan per keyword
+_TITLE_RESOURCE_TYPES = tuple(
+    (re.compile('|'.join(map(re.escape, keywords))), resource_type)
+    for keywords, resource_type in (
+        (('worksheet', 'activity', 'practice', 'exercise', 'assignment'), "WORKSHEET"),
+        (('quiz', 'test', 'assessment', 'exam', 'evaluation'), "QUIZ"),
+        (('lesson plan', 'lesson', 'curriculum', 'teaching plan', 'unit plan'), "LESSON_PLAN"),
+    )
+)
+
+def infer_resource_type(title):
+    """Guess a resource type from a lesson title, defaulting to PRESENTATION."""
+    title_lower = title.lower()
+    for pattern, resource_type in _TITLE_RESOURCE_TYPES:
+        if pattern.search(title_lower):
+            return resource_type
+    return "PRESENTATION"
+
 def generate_content_hash(lesson_data):
     """Generate a consistent hash for lesson content to detect duplicates."""
     if not lesson_data or not isinstance(lesson_data, dict):
@@ -77,39 +528,141 @@ def request_deduplication_middleware():
     
     return None
 
-def format_date(timestamp):
-    """Format timestamp into a user-friendly string."""
+def format_date(timestamp, now=None):
+    """Format timestamp into a user-friendly string (pass now when formatting many)."""
     if not timestamp:
         return "Unknown"
-        
-    now = datetime.now()
-    if hasattr(timestamp, 'tzinfo') and timestamp.tzinfo:
-        timestamp = timestamp.replace(tzinfo=None)
-    
-    delta = now - timestamp
+    if now is None:
+        now = datetime.now()
+    return _format_day(timestamp.date(), now.date())
+
+@lru_cache(maxsize=512)
+def _format_day(day, today):
+    days = (today - day).days
     
-    if delta.days == 0:
+    if days <= 0:
         return "Today"
-    elif delta.days == 1:
+    elif days == 1:
         return "Yesterday"
-    elif delta.days < 7:
-        return f"{delta.days} days ago"
+    elif days < 7:
+        return f"{days} days ago"
     else:
-        return timestamp.strftime("%b %d, %Y")
+        return day.strftime("%b %d, %Y")
+
+def _persist_history_item(user_id, user_email, title, resource_type, lesson_data):
+    """Upsert a signed-in user's history item; returns (row id, 'inserted'/'updated')."""
+    result = None  # Initialize result variable
+    action = 'unknown'  # Initialize action variable
+    
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            timestamp_col = _get_timestamp_col(cursor)
+            
+            # Generate content hash
+            content_hash = generate_content_hash(lesson_data)
+            if content_hash:
+                logger.debug("🔐 Generated content hash: %.8s... for lesson: %s", content_hash, title)
+            else:
+                logger.warning(f"⚠️ Content hash is NULL for lesson: {title}, lesson_data: {lesson_data}")
+                # Generate a fallback hash
+                fallback_string = f"{title}|{resource_type}|{user_email}"
+                content_hash = hashlib.sha256(fallback_string.encode()).hexdigest()
+                logger.info(f"🔄 Generated fallback hash: {content_hash[:8]}...")
+            
+            # Use UPSERT (INSERT ... ON CONFLICT) to prevent duplicates
+            lesson_data_json = _jdumps(lesson_data) if isinstance(lesson_data, dict) else lesson_data
+            
+            # Check if we have the content_hash and activity_date columns
+            available_cols = _get_activity_columns(cursor)
+            has_content_hash = 'content_hash' in available_cols
+            has_activity_date = 'activity_date' in available_cols
+            logger.debug("🗄️ Database columns - content_hash: %s, activity_date: %s", has_content_hash, has_activity_date)
+            
+            if has_content_hash and has_activity_date:
+                # Use the improved UPSERT with content hash and activity_date
+                # Ensure content_hash is not NULL (required for constraint)
+                if not content_hash:
+                    logger.error(f"❌ Cannot use UPSERT: content_hash is NULL")
+                    raise ValueError("Content hash cannot be NULL for UPSERT operation")
+                    
+                upsert_query = _HISTORY_UPSERT_SQL[timestamp_col]
+                
+                logger.debug("🔍 Executing UPSERT query: %s", upsert_query)
+                logger.debug("📝 UPSERT parameters: user_id=%s, activity=Created %s, content_hash=%.8s...", user_id, resource_type, content_hash)
+                
+                execute_prepared(cursor, f"history_upsert_{timestamp_col}", upsert_query, (
+                    user_id, 
+                    f"Created {resource_type}", 
+                    lesson_data_json,
+                    content_hash
+                ))
+                
+                result = cursor.fetchone()
+                action = result.get('action', 'unknown') if result else 'unknown'
+            else:
+                # Fallback to old method if content_hash doesn't exist: update an
+                # entry for the same topic/type from the last 5 minutes, else
+                # insert - both decided server-side in one round-trip
+                cursor.execute(_HISTORY_LEGACY_SAVE_SQL[timestamp_col], {
+                    'user_id': user_id,
+                    'title': title,
+                    'resource_type': resource_type,
+                    'lesson_data': lesson_data_json,
+                    'activity': f"Created {resource_type}"
+                })
+                result = cursor.fetchone()
+                action = result['action'] if result else 'unknown'
+            
+            # result is already fetched in both code paths above
+            
+            conn.commit()
+    
+    invalidate_history_cache(user_email)
+    result_id = result['id'] if result and 'id' in result else None
+    return result_id, action
+
+def _run_history_writer():
+    """Write queued history items in the background."""
+    while True:
+        args = _pending_history.get()
+        try:
+            result_id, action = _persist_history_item(*args)
+            logger.debug("History item %s in background with ID: %s", action, result_id)
+        except Exception as e:
+            logger.exception(f"Error writing queued history item: {e}")
+
+def _ensure_history_writer():
+    """Start the background history writer (again after a fork) if it is not running."""
+    global _history_writer
+    if _history_writer is not None and _history_writer.is_alive():
+        return
+    with _history_writer_lock:
+        if _history_writer is None or not _history_writer.is_alive():
+            _history_writer = threading.Thread(target=_run_history_writer, name='history-writer', daemon=True)
+            _history_writer.start()
+
+def flush_history():
+    """Synchronously write any queued history items (for shutdown hooks)."""
+    while True:
+        try:
+            args = _pending_history.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            _persist_history_item(*args)
+        except Exception as e:
+            logger.exception(f"Error writing queued history item: {e}")
+
+atexit.register(flush_history)
 
 @history_blueprint.route("/user/history", methods=["GET"])
 def get_user_history():
-    """Get history for the current user or session with HTTP caching."""
+    """Get history for the current user or session with HTTP caching.
+
+    ?summary=1 omits each item's lessonData (fetch it from /user/history/<db_id>,
+    or /user/history/anonymous/<id> for anonymous items).
+    """
     try:
-        # Support for HTTP cache headers
-        if request.headers.get('If-None-Match'):
-            etag = request.headers.get('If-None-Match')
-            session_id = session.get('session_id', '')
-            
-            if etag == session_id:
-                logger.debug("Returning 304 Not Modified for history request")
-                return '', 304
-        
         user_info = session.get('user_info', {})
         user_email = user_info.get('email')
         
@@ -119,156 +672,155 @@ def get_user_history():
         
         logger.info(f"🔍 GET /user/history - Fetching history for {'user: ' + user_email if user_email else 'anonymous user: ' + ip_address}")
         
+        summary = request.args.get('summary') in ('1', 'true')
         if user_email:
+            now = datetime.now()
+            today = now.date()
+            version, cached = _get_cached_history(user_email, summary, today)
+            etag = _history_etag(user_email, version, today) if version is not None else None
+            if etag and request.if_none_match.contains_weak(etag):
+                logger.debug("History unchanged for user %s, returning 304", user_email)
+                return _not_modified(etag)
+            if cached is not None:
+                logger.debug("Using cached history for user %s", user_email)
+                return _history_response(cached, etag)
+            
+            user_id = _resolve_user_id(user_email)
             with get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    # Check which timestamp column exists
-                    cursor.execute("""
-                        SELECT column_name 
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'user_activities'
-                        AND column_name IN ('activity_time', 'created_at');
-                    """)
-                    timestamp_cols = [row['column_name'] for row in cursor.fetchall()]
-                    timestamp_col = 'activity_time' if 'activity_time' in timestamp_cols else 'created_at'
-                    
-                    # Query with deduplication - get the most recent entry per content hash
-                    query = f"""
-                        WITH ranked_activities AS (
-                            SELECT a.id, a.activity, a.lesson_data, a.{timestamp_col} as timestamp,
-                                   a.content_hash,
-                                   ROW_NUMBER() OVER (
-                                       PARTITION BY COALESCE(a.content_hash, a.id::text)
-                                       ORDER BY a.{timestamp_col} DESC
-                                   ) as rn
-                            FROM user_activities a
-                            JOIN users u ON a.user_id = u.id
-                            WHERE u.email = %s
-                            AND a.lesson_data IS NOT NULL
-                        )
-                        SELECT id, activity, lesson_data, timestamp
-                        FROM ranked_activities 
-                        WHERE rn = 1
-                        ORDER BY timestamp DESC
-                        LIMIT 20
-                    """
+                # Tuple rows: the loop reads fixed columns, no per-row dict needed
+                with conn.cursor() as cursor:
+                    timestamp_col = _get_timestamp_col(cursor)
                     
-                    cursor.execute(query, (user_email,))
-                    results = cursor.fetchall()
-                    logger.info(f"📦 GET /user/history - Found {len(results)} unique history items for user {user_email}")
+                    if etag is None and user_id:
+                        # No Redis version counter: every save bumps the latest
+                        # timestamp and every delete the count, so with the day
+                        # (dates render relative to it) they make a stable ETag
+                        # that the composite index answers cheaply
+                        execute_prepared(cursor, f"history_etag_{timestamp_col}",
+                                         _HISTORY_ETAG_SQL[timestamp_col], (user_id,))
+                        latest, total = cursor.fetchone()
+                        etag = hashlib.blake2b(f"{user_id}:{latest}:{total}:{today}".encode(),
+                                               digest_size=8).hexdigest()
+                        if request.if_none_match.contains_weak(etag):
+                            logger.debug("History unchanged for user %s, returning 304", user_email)
+                            return _not_modified(etag)
                     
-                    # Debug: Show first few results
-                    if results:
-                        first_item = results[0]
-                        logger.debug(f"📋 Sample history item: ID {first_item['id']}, activity: {first_item['activity']}")
-                        if first_item.get('lesson_data'):
-                            lesson_data = first_item['lesson_data']
-                            if isinstance(lesson_data, str):
-                                import json
-                                try:
-                                    lesson_data = json.loads(lesson_data)
-                                except:
-                                    pass
-                            title = lesson_data.get('lessonTopic') if isinstance(lesson_data, dict) else 'Unknown'
-                            logger.debug(f"📋 Sample lesson title: {title}")
+                    # Query with deduplication - get the most recent entry per content hash
+                    query = _HISTORY_LIST_SQL[timestamp_col, summary]
                     
-                    # Format the results
+                    # lesson_data is JSONB, so psycopg2 already hands back dicts.
+                    # Rows are consumed straight off the cursor, no fetchall() copy.
                     history_items = []
-                    for item in results:
-                        resource_type = None
-                        lesson_data = {}
-                        
-                        if item.get('activity'):
-                            activity = item['activity']
-                            if activity.startswith('Created '):
-                                resource_type = activity.replace('Created ', '').strip()
-                        
-                        if item.get('lesson_data'):
-                            if isinstance(item['lesson_data'], str):
-                                try:
-                                    lesson_data = json.loads(item['lesson_data'])
-                                except:
-                                    lesson_data = {}
-                            else:
-                                lesson_data = item['lesson_data']
-                                
-                            if not resource_type:
-                                resource_type = lesson_data.get('resourceType', 'Presentation')
-                        
-                        if not resource_type:
-                            resource_type = 'Presentation'
-                        
-                        timestamp = item.get('timestamp')
-                        formatted_date = format_date(timestamp) if timestamp else "Recent"
-                        
-                        unique_id = f"{item['id']}-{resource_type}-{formatted_date}"
-                        
-                        title = (lesson_data.get("generatedTitle") or 
-                                lesson_data.get("lessonTopic") or 
-                                lesson_data.get("subjectFocus") or 
-                                "Untitled Lesson")
+                    if user_id:
+                        statement = f"history_{'summary' if summary else 'get'}_{timestamp_col}"
+                        execute_prepared(cursor, statement, query, (user_id,))
+                    # resource_type: "Created <TYPE>" activity, else lessonData.resourceType
+                    for db_id, timestamp, resource_type, title, *lesson_data in (cursor if user_id else ()):
+                        formatted_date = format_date(timestamp, now) if timestamp else "Recent"
                         
-                        history_items.append({
-                            "id": unique_id,
-                            "db_id": item["id"],
+                        history_item = {
+                            "id": f"{db_id}-{resource_type}-{formatted_date}",
+                            "db_id": db_id,
                             "title": title,
                             "types": [resource_type],
-                            "date": formatted_date,
-                            "lessonData": lesson_data
-                        })
-                    
-                    response = jsonify({
-                        "history": history_items,
-                        "user_authenticated": True
-                    })
-                    
-                    response.headers['Cache-Control'] = 'private, max-age=30'
-                    response.headers['ETag'] = str(hash(str(history_items)))
-                    return response
+                            "date": formatted_date
+                        }
+                        if lesson_data:
+                            history_item["lessonData"] = lesson_data[0] or {}
+                        history_items.append(history_item)
+            
+            # The pooled connection is back in the pool before serialization
+            logger.info(f"📦 GET /user/history - Found {len(history_items)} unique history items for user {user_email}")
+            
+            payload = _jdumps({
+                "history": history_items,
+                "user_authenticated": True
+            })
+            _cache_history(user_email, payload, summary, version, today)
+            return _history_response(payload, etag)
         
         # Anonymous user logic (unchanged)
         else:
-            cache_key = f"anon:{ip_address}"
-            if cache_key in anonymous_history_cache:
-                cache_time, history = anonymous_history_cache[cache_key]
-                if (datetime.now() - cache_time).total_seconds() < 30:
-                    logger.info(f"Using cached history for anonymous user {ip_address}")
-                    return jsonify({
-                        "history": history,
-                        "user_authenticated": False,
-                        "cache_hit": True
-                    })
+            # New visitors have no history anywhere: skip Redis entirely
+            if 'anon_history_id' not in session and not session.get('anonymous_history'):
+                return _history_response(_EMPTY_ANONYMOUS_HISTORY)
             
-            history = session.get('anonymous_history', [])
-            logger.info(f"Returning {len(history)} history items from session for anonymous user")
+            # Per-session storage (Redis list or the session itself) is the
+            # source of truth; an IP-keyed cache in front of it would leak
+            # history between visitors sharing an address
+            history = _load_anonymous_history()
+            logger.info(f"Returning {len(history)} history items for anonymous user")
             
-            for index, item in enumerate(history):
-                if 'id' not in item:
-                    item['id'] = f"session-{index}"
-                
+            _ensure_anonymous_history_ids(history)
+            for item in history:
                 if 'types' not in item or not isinstance(item['types'], list):
                     if item.get('lessonData', {}).get('resourceType'):
                         item['types'] = [item['lessonData']['resourceType']]
                     else:
                         item['types'] = ['Presentation']
             
-            anonymous_history_cache[cache_key] = (datetime.now(), history)
-            
-            response = jsonify({
-                "history": history,
+            return _history_response(_jdumps({
+                "history": _summarize_history(history) if summary else history,
                 "user_authenticated": False
-            })
-            
-            response.headers['Cache-Control'] = 'private, max-age=30'
-            response.headers['ETag'] = str(hash(str(history)))
-            return response
+            }))
         
     except Exception as e:
         logger.error(f"❌ Error fetching user history: {e}")
         logger.error(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+@history_blueprint.route("/user/history/<int:item_id>", methods=["GET"])
+def get_history_item(item_id):
+    """Get the full lessonData for one of the signed-in user's history items."""
+    try:
+        user_info = session.get('user_info', {})
+        user_email = user_info.get('email')
+        if not user_email:
+            return jsonify({"error": "Authentication required", "needsAuth": True}), 401
+        
+        user_id = _resolve_user_id(user_email)
+        if not user_id:
+            return jsonify({"error": "User not found"}), 404
+        
+        with get_db_cursor() as cursor:
+            execute_prepared(cursor, "history_item", """
+                SELECT lesson_data FROM user_activities
+                WHERE id = $1 AND user_id = $2
+            """, (item_id, user_id))
+            row = cursor.fetchone()
+        
+        if not row:
+            return jsonify({"error": "History item not found"}), 404
+        
+        return jsonify({
+            "db_id": item_id,
+            "lessonData": row['lesson_data'] or {}
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Error fetching history item {item_id}: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@history_blueprint.route("/user/history/anonymous/<item_id>", methods=["GET"])
+def get_anonymous_history_item(item_id):
+    """Get the full lessonData for one of this session's anonymous history items."""
+    try:
+        history = _load_anonymous_history()
+        _ensure_anonymous_history_ids(history)
+        for item in history:
+            if item.get('id') == item_id:
+                return jsonify({
+                    "id": item_id,
+                    "lessonData": item.get('lessonData', {})
+                })
+        return jsonify({"error": "History item not found"}), 404
+        
+    except Exception as e:
+        logger.error(f"❌ Error fetching anonymous history item {item_id}: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
 @history_blueprint.route("/user/history", methods=["POST"])
 def save_history_item():
     """Save a history item with proper deduplication."""
@@ -298,191 +850,60 @@ def save_history_item():
         
         # Intelligently determine resource type if not provided
         if not resource_type or resource_type == "PRESENTATION":
-            title_lower = title.lower()
-            
-            if any(keyword in title_lower for keyword in [
-                'worksheet', 'activity', 'practice', 'exercise', 'assignment'
-            ]):
-                resource_type = "WORKSHEET"
-            elif any(keyword in title_lower for keyword in [
-                'quiz', 'test', 'assessment', 'exam', 'evaluation'
-            ]):
-                resource_type = "QUIZ"
-            elif any(keyword in title_lower for keyword in [
-                'lesson plan', 'lesson', 'curriculum', 'teaching plan', 'unit plan'
-            ]):
-                resource_type = "LESSON_PLAN"
-            else:
-                resource_type = "PRESENTATION"
+            resource_type = infer_resource_type(title)
         
         logger.info(f"💾 POST /user/history - Saving history item: {title}, type: {resource_type}")
         
         user_info = session.get('user_info', {})
         user_email = user_info.get('email')
-        logger.debug(f"🔑 User info - email: {user_email}, authenticated: {bool(user_email)}")
+        logger.debug("🔑 User info - email: %s, authenticated: %s", user_email, bool(user_email))
         
         # For logged-in users, use UPSERT logic
         if user_email:
             logger.info(f"👤 POST /user/history - Saving history for authenticated user: {user_email}")
             
-            user = get_user_by_email(user_email)
-            if not user:
+            user_id = _resolve_user_id(user_email)
+            if not user_id:
                 logger.error(f"User not found: {user_email}")
                 return jsonify({"error": "User not found"}), 404
             
-            user_id = user["id"]
-            result = None  # Initialize result variable
-            action = 'unknown'  # Initialize action variable
+            queued = False
+            if HISTORY_WRITE_BEHIND:
+                _ensure_history_writer()
+                try:
+                    _pending_history.put_nowait((user_id, user_email, title, resource_type, lesson_data))
+                    queued = True
+                except queue.Full:
+                    logger.warning("History write-behind queue full, saving synchronously")
             
-            with get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    # Check which timestamp column exists
-                    cursor.execute("""
-                        SELECT column_name 
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'user_activities'
-                        AND column_name IN ('activity_time', 'created_at');
-                    """)
-                    timestamp_cols = [row['column_name'] for row in cursor.fetchall()]
-                    timestamp_col = 'activity_time' if 'activity_time' in timestamp_cols else 'created_at'
-                    
-                    # Generate content hash
-                    content_hash = generate_content_hash(lesson_data)
-                    if content_hash:
-                        logger.debug(f"🔐 Generated content hash: {content_hash[:8]}... for lesson: {title}")
-                    else:
-                        logger.warning(f"⚠️ Content hash is NULL for lesson: {title}, lesson_data: {lesson_data}")
-                        # Generate a fallback hash
-                        import hashlib
-                        fallback_string = f"{title}|{resource_type}|{user_email}"
-                        content_hash = hashlib.sha256(fallback_string.encode()).hexdigest()
-                        logger.info(f"🔄 Generated fallback hash: {content_hash[:8]}...")
-                    
-                    # Use UPSERT (INSERT ... ON CONFLICT) to prevent duplicates
-                    lesson_data_json = json.dumps(lesson_data) if isinstance(lesson_data, dict) else lesson_data
-                    
-                    # Check if we have the content_hash and activity_date columns
-                    cursor.execute("""
-                        SELECT column_name 
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'public' 
-                        AND table_name = 'user_activities'
-                        AND column_name IN ('content_hash', 'activity_date');
-                    """)
-                    available_cols = [row['column_name'] for row in cursor.fetchall()]
-                    has_content_hash = 'content_hash' in available_cols
-                    has_activity_date = 'activity_date' in available_cols
-                    logger.debug(f"🗄️ Database columns - content_hash: {has_content_hash}, activity_date: {has_activity_date}")
-                    
-                    if has_content_hash and has_activity_date:
-                        # Use the improved UPSERT with content hash and activity_date
-                        # Ensure content_hash is not NULL (required for constraint)
-                        if not content_hash:
-                            logger.error(f"❌ Cannot use UPSERT: content_hash is NULL")
-                            raise ValueError("Content hash cannot be NULL for UPSERT operation")
-                            
-                        upsert_query = f"""
-                            INSERT INTO user_activities (user_id, activity, lesson_data, content_hash, activity_date, {timestamp_col})
-                            VALUES (%s, %s, %s, %s, CURRENT_DATE, CURRENT_TIMESTAMP)
-                            ON CONFLICT ON CONSTRAINT unique_user_activity_daily
-                            DO UPDATE SET 
-                                lesson_data = EXCLUDED.lesson_data,
-                                activity = EXCLUDED.activity,
-                                {timestamp_col} = CURRENT_TIMESTAMP
-                            RETURNING id, 
-                                CASE WHEN xmax = 0 THEN 'inserted' ELSE 'updated' END as action
-                        """
-                        
-                        logger.debug(f"🔍 Executing UPSERT query: {upsert_query}")
-                        logger.debug(f"📝 UPSERT parameters: user_id={user_id}, activity=Created {resource_type}, content_hash={content_hash[:8] if content_hash else 'NULL'}...")
-                        
-                        cursor.execute(upsert_query, (
-                            user_id, 
-                            f"Created {resource_type}", 
-                            lesson_data_json,
-                            content_hash
-                        ))
-                        
-                        result = cursor.fetchone()
-                        action = result.get('action', 'unknown') if result else 'unknown'
-                    else:
-                        # Fallback to old method if content_hash doesn't exist
-                        # Check for existing entry manually
-                        cursor.execute(f"""
-                            SELECT id FROM user_activities 
-                            WHERE user_id = %s 
-                            AND lesson_data->>'lessonTopic' = %s
-                            AND lesson_data->>'resourceType' = %s
-                            AND {timestamp_col} > CURRENT_TIMESTAMP - INTERVAL '5 minutes'
-                            LIMIT 1
-                        """, (user_id, title, resource_type))
-                        
-                        existing = cursor.fetchone()
-                        
-                        if existing:
-                            # Update existing entry
-                            cursor.execute(f"""
-                                UPDATE user_activities 
-                                SET lesson_data = %s, 
-                                    activity = %s,
-                                    {timestamp_col} = CURRENT_TIMESTAMP
-                                WHERE id = %s
-                                RETURNING id
-                            """, (lesson_data_json, f"Created {resource_type}", existing['id']))
-                            result = cursor.fetchone()
-                            action = 'updated'
-                        else:
-                            # Insert new entry
-                            cursor.execute(f"""
-                                INSERT INTO user_activities (user_id, activity, lesson_data, {timestamp_col})
-                                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                                RETURNING id
-                            """, (user_id, f"Created {resource_type}", lesson_data_json))
-                            result = cursor.fetchone()
-                            action = 'inserted'
-                    
-                    # result is already fetched in both code paths above
-                    
-                    conn.commit()
-                    
-                    # Clear cache
-                    ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
-                    if ip_address:
-                        ip_address = ip_address.split(',')[0].strip()
-                    cache_key = f"anon:{ip_address}"
-                    if cache_key in anonymous_history_cache:
-                        del anonymous_history_cache[cache_key]
-                    
-                    # Get final action word and result info
-                    action_word = action
-                    result_id = result['id'] if result and 'id' in result else None
-                    
-                    logger.info(f"✅ POST /user/history - History item {action_word} successfully with ID: {result_id}")
-                    logger.debug(f"📊 UPSERT result: {result}")
-                    
-                    return jsonify({
-                        "success": True,
-                        "id": result_id,
-                        "action": action_word,
-                        "message": f"History item {action_word} successfully"
-                    })
+            if queued:
+                # Drop the cached list now; the writer invalidates again once the row lands
+                invalidate_history_cache(user_email)
+                result_id, action_word, status = None, 'queued', 202
+            else:
+                result_id, action_word = _persist_history_item(user_id, user_email, title, resource_type, lesson_data)
+                status = 201 if action_word == 'inserted' else 200
+            
+            logger.info(f"✅ POST /user/history - History item {action_word} successfully with ID: {result_id}")
+            
+            headers = {"Location": f"/user/history/{result_id}"} if result_id else {}
+            return jsonify({
+                "success": True,
+                "id": result_id,
+                "action": action_word,
+                "message": f"History item {action_word} successfully"
+            }), status, headers
         
         # Anonymous user logic (unchanged but with better duplicate detection)
         else:
             logger.info("Saving history for anonymous user")
             
-            ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
-            if ip_address:
-                ip_address = ip_address.split(',')[0].strip()
-            
-            if 'anonymous_history' not in session:
-                session['anonymous_history'] = []
+            history = _load_anonymous_history()
             
             # Better duplicate detection for anonymous users
             content_hash = generate_content_hash(lesson_data)
-            existing_items = [
-                item for item in session['anonymous_history'] 
+            existing_indexes = [
+                index for index, item in enumerate(history)
                 if (
                     item.get('title') == title and 
                     item.get('types', [''])[0] == resource_type and
@@ -490,36 +911,28 @@ def save_history_item():
                 )
             ]
             
-            if existing_items:
+            if existing_indexes:
                 # Update the existing item instead of creating a new one
-                for item in existing_items:
-                    item['lessonData'] = lesson_data
-                    item['date'] = 'Today'
+                for index in existing_indexes:
+                    history[index]['lessonData'] = lesson_data
+                    history[index]['date'] = 'Today'
+                _save_anonymous_history(history, updated_indexes=existing_indexes)
                 action = 'updated'
             else:
                 # Add new item to history
                 history_item = {
-                    "id": f"session-{len(session['anonymous_history'])}",
+                    "id": _new_anonymous_history_id(),
                     "title": title,
                     "types": [resource_type],
                     "date": "Today",
                     "lessonData": lesson_data
                 }
                 
-                session['anonymous_history'].insert(0, history_item)
+                _save_anonymous_history(history, new_item=history_item)
+                history = ([history_item] + history)[:ANONYMOUS_HISTORY_MAX_ITEMS]
                 action = 'inserted'
             
-            # Limit history to 10 items
-            if len(session['anonymous_history']) > 10:
-                session['anonymous_history'] = session['anonymous_history'][:10]
-            
-            session.modified = True
-            
-            # Update the cache
-            cache_key = f"anon:{ip_address}"
-            anonymous_history_cache[cache_key] = (datetime.now(), session['anonymous_history'])
-            
-            logger.info(f"History item {action} to session, total items: {len(session['anonymous_history'])}")
+            logger.info(f"History item {action} to anonymous history, total items: {len(history)}")
             
             return jsonify({
                 "success": True,
@@ -542,13 +955,11 @@ def clear_history():
         if user_email:
             logger.info(f"Clearing history for authenticated user: {user_email}")
             
-            user = get_user_by_email(user_email)
-            if not user:
+            user_id = _resolve_user_id(user_email)
+            if not user_id:
                 logger.error(f"User not found: {user_email}")
                 return jsonify({"error": "User not found"}), 404
             
-            user_id = user["id"]
-            
             with get_db_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute("""
@@ -557,25 +968,17 @@ def clear_history():
                     """, (user_id,))
                     
                     conn.commit()
-                    
-                    return jsonify({
-                        "success": True,
-                        "message": "History cleared successfully"
-                    })
+            
+            invalidate_history_cache(user_email)
+            return jsonify({
+                "success": True,
+                "message": "History cleared successfully"
+            })
         
         else:
             logger.info("Clearing history for anonymous user")
             
-            session['anonymous_history'] = []
-            session.modified = True
-            
-            # Clear cache for this IP
-            ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
-            if ip_address:
-                ip_address = ip_address.split(',')[0].strip()
-            cache_key = f"anon:{ip_address}"
-            if cache_key in anonymous_history_cache:
-                del anonymous_history_cache[cache_key]
+            _clear_anonymous_history()
             
             return jsonify({
                 "success": True,
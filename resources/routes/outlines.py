@@ -1,11 +1,19 @@
 # resources/routes/outlines.py - Updated with DeepSeek API support and Agent integration
 import os
 import re
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, session
 from config.settings import logger, client
 from utils.decorators import check_usage_limits
 import json
 import traceback
+from functools import lru_cache
+
+# Optional orjson import - faster outline serialization when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # Import agent coordinator for enhanced content generation
 from agents.coordinator import AgentCoordinator
@@ -13,6 +21,18 @@ from core.services.content_cache import ContentCacheService
 
 outline_blueprint = Blueprint("outline_blueprint", __name__)
 
+def _jdumps(payload):
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'))
+
+# orjson emits bytes, stdlib json emits str
+_NDJSON_NEWLINE = b"\n" if ORJSON_AVAILABLE else "\n"
+
+def _json_response(payload):
+    """Serialize an outline payload without going through jsonify's pure-Python encoder."""
+    return Response(_jdumps(payload), mimetype='application/json')
+
 # Clean example data with new structure
 EXAMPLE_OUTLINE_DATA = {
     "title": "Equivalent Fractions Lesson",
@@ -53,15 +73,25 @@ Content:
     ]
 }
 
+# (lessonTopic, gradeLevel, subjectFocus, language) combinations served from example data
+_EXAMPLE_KEYS = frozenset({
+    ("equivalent fractions", "4th grade", "math", "english"),
+})
+
 def is_example_request(data):
     """Check if this is an example request that shouldn't count against limits."""
-    return (
-        data.get("use_example") or
-        (data.get("lessonTopic", "").lower().strip() == "equivalent fractions" and
-         data.get("gradeLevel", "").lower().strip() == "4th grade" and
-         data.get("subjectFocus", "").lower().strip() == "math" and
-         data.get("language", "").lower().strip() == "english")
+    if data.get("use_example"):
+        return True
+    key = tuple(
+        data.get(field, "").strip().lower()
+        for field in ("lessonTopic", "gradeLevel", "subjectFocus", "language")
     )
+    return key in _EXAMPLE_KEYS
+
+@lru_cache(maxsize=None)
+def _example_outline_body():
+    """Serialized example outline, encoded on first use and reused by the process."""
+    return _jdumps(EXAMPLE_OUTLINE_DATA)
 
 # Test data that doesn't call DeepSeek API
 TEST_OUTLINE_DATA = {
@@ -193,22 +223,10 @@ def generate_outline_title(form_data, structured_content=None):
         logger.error(f"Error generating outline title: {e}")
         return "Educational Resource"
     
-def get_system_prompt(resource_type="PRESENTATION"):
-    """Get the appropriate system prompt based on resource type."""
-    normalized_type = resource_type.upper() if resource_type else "PRESENTATION"
-    
-    # Handle various formats of resource types
-    if "QUIZ" in normalized_type or "TEST" in normalized_type:
-        normalized_type = "QUIZ"
-    elif "LESSON" in normalized_type and "PLAN" in normalized_type:
-        normalized_type = "LESSON_PLAN"
-    elif "WORKSHEET" in normalized_type or "ACTIVITY" in normalized_type:
-        normalized_type = "WORKSHEET"
-    elif "PRESENTATION" in normalized_type or "SLIDE" in normalized_type:
-        normalized_type = "PRESENTATION"
-    
-    if normalized_type == "WORKSHEET":
-        return """
+# System prompts per normalized resource type. Built once at import; the
+# message dicts are shared across requests, so callers must not mutate them.
+_SYSTEM_PROMPTS = {
+    "WORKSHEET": """
         YOU ARE A MASTER WORKSHEET CREATOR. Your task is to create educational worksheets with clean separation between student content and teacher guidance.
 
         CRITICAL MULTILINGUAL REQUIREMENTS:
@@ -265,10 +283,8 @@ def get_system_prompt(resource_type="PRESENTATION"):
         - Teacher note: Recuerda a los estudiantes alinear los números por valor posicional
         
         IMPORTANT: Notice that questions and explanations are in Spanish, but "Answer:", "Differentiation tip:", and "Teacher note:" remain in English for proper parsing.
-        """
-    
-    elif normalized_type == "QUIZ":
-        return """
+        """,
+    "QUIZ": """
         YOU ARE A MASTER QUIZ AND TEST CREATOR. Your task is to produce educational assessments with clean, professional formatting.
 
         CRITICAL MULTILINGUAL REQUIREMENTS:
@@ -308,10 +324,8 @@ def get_system_prompt(resource_type="PRESENTATION"):
 
         - Differentiation tip: Allow students to sketch visuals or use manipulatives
         - Teacher note: Review numerator/denominator before the quiz if needed
-        """
-    
-    elif normalized_type == "LESSON_PLAN":
-        return """
+        """,
+    "LESSON_PLAN": """
         YOU ARE A MASTER LESSON PLAN CREATOR. Your task is to produce comprehensive, ready-to-use lesson plans.
 
         CRITICAL MULTILINGUAL REQUIREMENTS:
@@ -354,11 +368,8 @@ def get_system_prompt(resource_type="PRESENTATION"):
 
         - Differentiation tip: Use fraction tiles for hands-on exploration
         - Assessment check: Have students hold up a card showing whether two fractions are equal
-        """
-    
-    else:
-        # Default to presentation format
-        return """
+        """,
+    "PRESENTATION": """
         YOU ARE A MASTER CLASSROOM PRESENTATION CREATOR. Your task is to create slide content with clean, professional formatting.
 
         CRITICAL MULTILINGUAL REQUIREMENTS:
@@ -397,23 +408,62 @@ def get_system_prompt(resource_type="PRESENTATION"):
         - The denominator (bottom number) tells us the total number of equal parts
         - Fractions help us measure ingredients in cooking and divide objects equally
         - Students will identify, compare, and solve problems using fractions
-        """
+        """,
+}
+
+_SYSTEM_MESSAGES = {
+    prompt_type: {"role": "system", "content": prompt}
+    for prompt_type, prompt in _SYSTEM_PROMPTS.items()
+}
+
+def _normalize_prompt_type(resource_type):
+    normalized_type = resource_type.upper() if resource_type else "PRESENTATION"
+    
+    # Handle various formats of resource types
+    if "QUIZ" in normalized_type or "TEST" in normalized_type:
+        return "QUIZ"
+    elif "LESSON" in normalized_type and "PLAN" in normalized_type:
+        return "LESSON_PLAN"
+    elif "WORKSHEET" in normalized_type or "ACTIVITY" in normalized_type:
+        return "WORKSHEET"
+    # Default to presentation format
+    return "PRESENTATION"
+
+def get_system_prompt(resource_type="PRESENTATION"):
+    """Get the appropriate system prompt based on resource type."""
+    return _SYSTEM_PROMPTS[_normalize_prompt_type(resource_type)]
+
+def get_system_message(resource_type="PRESENTATION"):
+    """Get the shared system message dict for the chat completion call."""
+    return _SYSTEM_MESSAGES[_normalize_prompt_type(resource_type)]
               
+# User prompt for the DeepSeek fallback; filled with str.format per request
+_USER_PROMPT_TEMPLATE = """
+        Create a comprehensive {resource_type} with the following specifications:
+        {requirements_str}
+
+        Additional Requirements:
+        {custom_prompt}
+        """
+
+_SLIDE_HEADER_RE = re.compile(r"Slide (\d+):\s*(.*)")
+_SECTION_HEADER_RE = re.compile(r"Section (\d+):\s*(.*)")
+
 def parse_outline_to_clean_structure(outline_text, resource_type="PRESENTATION"):
     """Parse outline text into clean, consistent structure for all resource types."""
     logger.info(f"Parsing outline for resource type: {resource_type}")
     
     # Determine section/slide pattern based on resource type
     if resource_type.upper() == "PRESENTATION":
-        section_pattern = r"Slide (\d+):\s*(.*)"
-        section_word = "Slide"
+        match_header = _SLIDE_HEADER_RE.match
     else:
-        section_pattern = r"Section (\d+):\s*(.*)"
-        section_word = "Section"
+        match_header = _SECTION_HEADER_RE.match
     
     # Split by section headers
     sections = []
     current_section = None
+    # Bound to current_section["content"] so each line appends without a dict lookup
+    current_content = None
     
     lines = outline_text.strip().split('\n')
     
@@ -423,32 +473,32 @@ def parse_outline_to_clean_structure(outline_text, resource_type="PRESENTATION")
             continue
             
         # Check if this is a section/slide header
-        match = re.match(section_pattern, line)
+        match = match_header(line)
         if match:
             # Save previous section
             if current_section:
                 sections.append(current_section)
             
             # Start new section
-            section_num = match.group(1)
             section_title = match.group(2).strip()
+            current_content = []
             current_section = {
                 "title": section_title,
                 "layout": "TITLE_AND_CONTENT",
-                "content": []
+                "content": current_content
             }
         elif line.lower() == "content:":
             # Skip content headers
             continue
-        elif line.startswith('-') or line.startswith('•'):
+        elif line.startswith(('-', '•')):
             # This is content
             if current_section:
                 clean_content = line.lstrip('-•').strip()
                 if clean_content:
-                    current_section["content"].append(clean_content)
-        elif current_section and line:
+                    current_content.append(clean_content)
+        elif current_section:
             # Any other non-empty line goes to content
-            current_section["content"].append(line)
+            current_content.append(line)
     
     # Don't forget the last section
     if current_section:
@@ -465,6 +515,61 @@ def parse_outline_to_clean_structure(outline_text, resource_type="PRESENTATION")
     logger.info(f"Successfully parsed {len(sections)} sections for {resource_type}")
     return sections
 
+def build_outline_result(data, outline_text, resource_type):
+    """Parse generated outline text into the response payload returned to the client."""
+    # Parse into clean structure
+    structured_content = parse_outline_to_clean_structure(outline_text, resource_type)
+    
+    # Generate title
+    generated_title = generate_outline_title(data, structured_content)
+    logger.info(f"Generated title: {generated_title}")
+
+    return {
+        "title": generated_title,
+        "messages": [outline_text],
+        "structured_content": structured_content,
+        "resource_type": resource_type.lower()
+    }
+
+def wants_outline_stream(data):
+    """Check if the client asked for an NDJSON token stream instead of a single JSON body."""
+    return bool(data.get("stream")) or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def stream_outline(data, messages, resource_type):
+    """Yield NDJSON lines: one {"delta": ...} per streamed chunk, then the full outline payload."""
+    chunks = []
+    try:
+        response = client.chat.completions.create(
+            model="deepseek-chat",
+            messages=messages,
+            max_tokens=4000,
+            temperature=0.7,
+            stream=True
+        )
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                yield _jdumps({"delta": delta}) + _NDJSON_NEWLINE
+
+        outline_text = "".join(chunks).strip()
+        logger.debug(f"Generated outline (streamed): {outline_text}")
+
+        result = build_outline_result(data, outline_text, resource_type)
+        result["done"] = True
+        yield _jdumps(result) + _NDJSON_NEWLINE
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logger.error(f"Error streaming outline generation: {str(e)}")
+        logger.error(traceback.format_exc())
+        yield _jdumps({
+            "error": "An unexpected error occurred",
+            "details": str(e),
+            "done": True
+        }) + _NDJSON_NEWLINE
+
 @outline_blueprint.route("/outline", methods=["POST", "OPTIONS"])
 @check_usage_limits(action_type='generation')  # This will check and increment generation limits
 def get_outline():
@@ -481,7 +586,13 @@ def get_outline():
                 "details": "Request must be in JSON format"
             }), 400
 
-        data = request.json
+        # check_usage_limits already parsed the body; get_json() reuses that cached result
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({
+                "error": "Invalid request format",
+                "details": "Request body is not valid JSON"
+            }), 400
         logger.debug(f"Received outline request with data: {data}")
 
         # Check for example outline first (before any processing)
@@ -492,7 +603,7 @@ def get_outline():
                 # Continue to agent processing below
             else:
                 logger.info("Example request - returning standard example outline")
-                return jsonify(EXAMPLE_OUTLINE_DATA)
+                return Response(_example_outline_body(), mimetype='application/json')
 
         # NEW: Check for test request (counts against limits but doesn't call DeepSeek)
         if is_test_request(data):
@@ -501,7 +612,7 @@ def get_outline():
             test_title = f"Test Lesson - {data.get('lessonTopic', 'Generic Test')}"
             test_data = TEST_OUTLINE_DATA.copy()
             test_data["title"] = test_title
-            return jsonify(test_data)
+            return _json_response(test_data)
 
         # Validate and set default values for real DeepSeek requests
         resource_type = data.get('resourceType', 'Presentation')
@@ -547,7 +658,7 @@ def get_outline():
                     generated_title = generate_outline_title(data, cached_result["structured_content"])
                     
                     logger.info("⚡ Serving content from cache - no usage limit deducted!")
-                    return jsonify({
+                    return _json_response({
                         "title": generated_title,
                         "structured_content": cached_result["structured_content"],
                         "resource_type": resource_type.lower(),
@@ -605,7 +716,7 @@ def get_outline():
                 
                 # Return clean structured format - no legacy duplication
                 logger.info(f"Agent-based generation complete: {len(structured_content)} sections")
-                return jsonify({
+                return _json_response({
                     "title": generated_title,
                     "structured_content": structured_content,
                     "resource_type": resource_type.lower(),
@@ -631,27 +742,31 @@ def get_outline():
             f"Standards: {', '.join(selected_standards) if selected_standards else 'General Learning Objectives'}"
         ]
 
-        requirements_str = "\n".join(f"- {req}" for req in requirements)
+        requirements_str = "- " + "\n- ".join(requirements)
 
         # Get system instructions
-        system_instructions = {
-            "role": "system",
-            "content": get_system_prompt(resource_type)
-        }
+        system_instructions = get_system_message(resource_type)
 
         # Create user prompt
-        user_prompt = f"""
-        Create a comprehensive {resource_type} with the following specifications:
-        {requirements_str}
+        user_prompt = _USER_PROMPT_TEMPLATE.format(
+            resource_type=resource_type,
+            requirements_str=requirements_str,
+            custom_prompt=custom_prompt
+        )
 
-        Additional Requirements:
-        {custom_prompt}
-        """
+        messages = [system_instructions, {"role": "user", "content": user_prompt}]
+
+        # Opt-in streaming: relay tokens as NDJSON while the model is still generating
+        if wants_outline_stream(data):
+            return Response(
+                stream_outline(data, messages, resource_type),
+                mimetype='application/x-ndjson'
+            )
 
         # Make the DeepSeek API call using the deepseek-chat model
         response = client.chat.completions.create(
             model="deepseek-chat",  # Using DeepSeek's chat model
-            messages=[system_instructions, {"role": "user", "content": user_prompt}],
+            messages=messages,
             max_tokens=4000,
             temperature=0.7,
             stream=False
@@ -660,20 +775,8 @@ def get_outline():
         outline_text = response.choices[0].message.content.strip()
         logger.debug(f"Generated outline: {outline_text}")
 
-        # Parse into clean structure
-        structured_content = parse_outline_to_clean_structure(outline_text, resource_type)
-        
-        # Generate title
-        generated_title = generate_outline_title(data, structured_content)
-        logger.info(f"Generated title: {generated_title}")
-
         # Return clean response
-        return jsonify({
-            "title": generated_title,
-            "messages": [outline_text],
-            "structured_content": structured_content,
-            "resource_type": resource_type.lower()
-        })
+        return _json_response(build_outline_result(data, outline_text, resource_type))
 
     except Exception as e:
         logger.error(f"Error in outline generation: {str(e)}")
@@ -684,20 +787,22 @@ def get_outline():
             "details": str(e)
         }), 500
 
+# Origins allowed to call the outline endpoint with credentials
+_ALLOWED_ORIGINS = frozenset({
+    'http://localhost:3000',
+    'https://teacherfy.ai',
+    'https://teacherfy-gma6hncme7cpghda.westus-01.azurewebsites.net'
+})
+
 # Helper route to handle CORS preflight
 @outline_blueprint.after_request
 def after_request(response):
     origin = request.headers.get('Origin')
-    allowed_origins = [
-        'http://localhost:3000',
-        'https://teacherfy.ai',
-        'https://teacherfy-gma6hncme7cpghda.westus-01.azurewebsites.net'
-    ]
     
-    if origin in allowed_origins:
-        response.headers.add('Access-Control-Allow-Origin', origin)
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+    if origin in _ALLOWED_ORIGINS:
+        response.headers.set('Access-Control-Allow-Origin', origin)
+        response.headers.set('Access-Control-Allow-Credentials', 'true')
+        response.headers.set('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.set('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
     
     return response
\ No newline at end of file
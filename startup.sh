@@ -162,7 +162,10 @@ start_prod_server() {
         WORKERS=2  # Default for Azure App Service
     fi
     
-    echo -e "${YELLOW}Using $WORKERS workers on port $PORT${NC}"
+    # Threads per worker; I/O-bound views overlap DB/Redis waits within a process
+    THREADS=${GUNICORN_THREADS:-8}
+    
+    echo -e "${YELLOW}Using $WORKERS workers x $THREADS threads on port $PORT${NC}"
     
     # Setup signal handlers for graceful shutdown
     trap 'stop_celery_worker; exit' SIGTERM SIGINT
@@ -170,6 +173,8 @@ start_prod_server() {
     # Start Gunicorn
     gunicorn --bind=0.0.0.0:$PORT \
         --workers=$WORKERS \
+        --worker-class=gthread \
+        --threads=$THREADS \
         --timeout=120 \
         --log-level=info \
         --access-logfile=- \
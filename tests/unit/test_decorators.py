@@ -0,0 +1,57 @@
+import json
+import pytest
+from unittest.mock import patch
+from flask import Flask, Response, jsonify
+
+from utils.decorators import check_usage_limits
+
+LIMITS = {
+    'hourly_exceeded': False,
+    'can_generate': True,
+    'can_download': True,
+    'generations_left': 4,
+    'downloads_left': 5,
+    'reset_time': '2026-11-01T00:00:00',
+    'tier': 'free',
+    'monthly_used': {'generations': 1, 'downloads': 0},
+    'tracking_method': 'ip_address',
+}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+
+    @app.route('/stream', methods=['POST'])
+    @check_usage_limits(action_type='generation')
+    def stream_view():
+        def generate():
+            yield json.dumps({"delta": "Slide 1"}) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    @app.route('/json', methods=['POST'])
+    @check_usage_limits(action_type='generation')
+    def json_view():
+        return jsonify({"ok": True})
+
+    with patch("utils.decorators.UsageTracker") as tracker:
+        tracker.check_limits.return_value = dict(LIMITS)
+        with app.test_client() as test_client:
+            yield test_client
+
+
+def test_streamed_response_passes_through(client):
+    response = client.post('/stream', json={"stream": True})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == [{"delta": "Slide 1"}, {"done": True}]
+
+
+def test_json_response_gets_usage_limits(client):
+    response = client.post('/json', json={"lessonTopic": "Volcanoes"})
+    data = response.get_json()
+    assert data["ok"] is True
+    assert data["usage_limits"]["generations_left"] == 4
@@ -0,0 +1,52 @@
+import pytest
+from datetime import date
+
+from resources.routes.history import (
+    _format_day,
+    _pack_anonymous_history,
+    _unpack_anonymous_history,
+    infer_resource_type,
+)
+
+
+@pytest.mark.parametrize("title, expected", [
+    ("Fractions Practice Worksheet", "WORKSHEET"),
+    ("Unit 3 Quiz", "QUIZ"),
+    ("Photosynthesis Lesson Plan", "LESSON_PLAN"),
+    ("Solar System", "PRESENTATION"),
+    # Earlier types win when a title matches several
+    ("Lesson review activity", "WORKSHEET"),
+])
+def test_infer_resource_type(title, expected):
+    assert infer_resource_type(title) == expected
+
+
+def test_pack_anonymous_history_round_trips():
+    shared = {"lessonTopic": "Volcanoes", "gradeLevel": "5th grade"}
+    history = [
+        {"id": "session-a", "title": "Volcanoes", "lessonData": shared},
+        {"id": "session-b", "title": "Volcanoes again", "lessonData": dict(shared)},
+        {"id": "session-c", "title": "Rivers", "lessonData": {"lessonTopic": "Rivers"}},
+    ]
+    packed = _pack_anonymous_history(history)
+    # Equal lessonData blobs are stored once
+    assert len(packed["index"]) == 2
+    assert _unpack_anonymous_history(packed) == history
+
+
+def test_unpack_anonymous_history_legacy_and_empty():
+    legacy = [{"id": "session-a", "title": "Old", "lessonData": {}}]
+    assert _unpack_anonymous_history(legacy) == legacy
+    assert _unpack_anonymous_history(None) == []
+    assert _unpack_anonymous_history({}) == []
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2026, 10, 17), "Today"),
+    (date(2026, 10, 18), "Today"),
+    (date(2026, 10, 16), "Yesterday"),
+    (date(2026, 10, 11), "6 days ago"),
+    (date(2026, 10, 10), "Oct 10, 2026"),
+])
+def test_format_day(day, expected):
+    assert _format_day(day, date(2026, 10, 17)) == expected
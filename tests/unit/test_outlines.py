@@ -0,0 +1,43 @@
+from resources.routes.outlines import parse_outline_to_clean_structure
+
+OUTLINE = """Slide 1: Let's Explore Fractions!
+Content:
+- Fractions name equal parts
+• A whole can be split many ways
+
+Slide 2: Equivalent Fractions
+Content:
+- 1/2 is the same amount as 2/4
+Teacher tip without a bullet
+"""
+
+
+def test_parse_presentation_slides():
+    assert parse_outline_to_clean_structure(OUTLINE) == [
+        {
+            "title": "Let's Explore Fractions!",
+            "layout": "TITLE_AND_CONTENT",
+            "content": ["Fractions name equal parts", "A whole can be split many ways"],
+        },
+        {
+            "title": "Equivalent Fractions",
+            "layout": "TITLE_AND_CONTENT",
+            "content": ["1/2 is the same amount as 2/4", "Teacher tip without a bullet"],
+        },
+    ]
+
+
+def test_parse_sections_for_other_resource_types():
+    outline = "Section 1: Warm Up\n- Review halves\nSection 2: Practice\n- Shade 3/4"
+    sections = parse_outline_to_clean_structure(outline, "WORKSHEET")
+    assert [s["title"] for s in sections] == ["Warm Up", "Practice"]
+    assert sections[1]["content"] == ["Shade 3/4"]
+
+
+def test_parse_without_headers_falls_back():
+    sections = parse_outline_to_clean_structure("Just some text\n\nand more")
+    assert sections == [{
+        "title": "Generated Content",
+        "layout": "TITLE_AND_CONTENT",
+        "content": ["Just some text", "and more"],
+    }]
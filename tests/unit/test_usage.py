@@ -0,0 +1,43 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from core.database import usage
+from core.database.usage import _cached_reset_iso, _month_index, _normalize_ip
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("203.0.113.5", "203.0.113.5"),
+    (" 203.0.113.5 ", "203.0.113.5"),
+    ("203.0.113.5:8080", "203.0.113.5"),
+    ("[2001:db8::1]:443", "2001:db8::1"),
+    ("2001:0db8:0000:0000:0000:0000:0000:0001", "2001:db8::1"),
+])
+def test_normalize_ip_canonicalizes(raw, expected):
+    assert _normalize_ip(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["999.1.1.1", "not-an-ip", "", "fe80::1%eth0"])
+def test_normalize_ip_rejects_invalid(raw):
+    assert _normalize_ip(raw) is None
+
+
+def test_month_index_matches_within_a_month():
+    first = datetime(2026, 3, 1, 0, 0, tzinfo=timezone.utc)
+    last = datetime(2026, 3, 31, 23, 59, tzinfo=timezone.utc)
+    assert _month_index(first) == _month_index(last) == 2026 * 12 + 2
+
+
+def test_month_index_rolls_over_the_year():
+    december = datetime(2025, 12, 31, tzinfo=timezone.utc)
+    january = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert _month_index(january) == _month_index(december) + 1
+
+
+def test_cached_reset_iso_is_next_month_start():
+    usage._RESET_CACHE.clear()
+    with patch.object(usage, "_current_month_index", return_value=2026 * 12 + 11):
+        assert _cached_reset_iso() == "2027-01-01T00:00:00+00:00"
+    with patch.object(usage, "_current_month_index", return_value=2026 * 12 + 9):
+        assert _cached_reset_iso() == "2026-11-01T00:00:00+00:00"
+    usage._RESET_CACHE.clear()